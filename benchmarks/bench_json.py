@@ -0,0 +1,122 @@
+"""JSON 編解碼基準測試：比較標準庫 json 與 epg_json 後端
+
+使用與三個來源相同結構的負載:
+  - Hami getEpgByContentIdAndDate 單頻道單日回應
+  - 四季線上 ProgList 單頻道節目表
+  - ofiii 觀看頁面 __NEXT_DATA__
+  - output/fourgtv.json 頻道清單（編碼，縮排寫檔）
+
+用法: python benchmarks/bench_json.py [--repeat 200]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import epg_json
+
+TITLES = ["民視晚間新聞", "市井豪門", "綜藝大集合", "風水世家", "親戚不計較", "午間新聞", "晨間新聞"]
+DESC = "每周一到周五播出全國第一名八點檔大戲，除了優質節目，也可以隨時掌握最新最重要的國內外大事與最權威的觀點。"
+
+
+def hami_payload():
+    day = datetime(2025, 8, 1)
+    elements = []
+    for i in range(48):
+        start = day + timedelta(minutes=30 * i)
+        end = start + timedelta(minutes=30)
+        elements.append({
+            "title": "民視",
+            "contentPk": "OTT_LIVE_0000001852",
+            "programInfo": [{
+                "programName": TITLES[i % len(TITLES)],
+                "description": DESC,
+                "hintSE": f"{start:%Y-%m-%d %H:%M:%S}~{end:%Y-%m-%d %H:%M:%S}",
+                "contentType": "1",
+            }],
+        })
+    return {"UIInfo": [{"title": "節目表", "elements": elements}], "code": "000"}
+
+
+def fourgtv_payload():
+    day = datetime(2025, 8, 1)
+    items = []
+    for i in range(7 * 24):
+        start = day + timedelta(hours=i)
+        end = start + timedelta(hours=1)
+        items.append({
+            "sdate": f"{start:%Y-%m-%d}", "stime": f"{start:%H:%M:%S}",
+            "edate": f"{end:%Y-%m-%d}", "etime": f"{end:%H:%M:%S}",
+            "title": TITLES[i % len(TITLES)], "content": DESC,
+        })
+    return items
+
+
+def ofiii_payload():
+    start = datetime(2025, 8, 1)
+    schedule = []
+    for i in range(7 * 48):
+        schedule.append({
+            "AirDateTime": f"{start + timedelta(minutes=30 * i):%Y-%m-%dT%H:%M:%SZ}",
+            "Duration": 1800,
+            "program": {"Title": TITLES[i % len(TITLES)], "SubTitle": f"第{i}集", "Description": DESC},
+        })
+    return {
+        "props": {"pageProps": {
+            "channel": {"picture": "pics/logo_litv_nnews_tv.png", "description": DESC, "Schedule": schedule},
+            "introduction": {"image": "pics/intro.png", "description": DESC},
+        }},
+        "page": "/channel/watch/[contentId]", "query": {"contentId": "nnews-vn"}, "buildId": "x" * 20,
+    }
+
+
+def channel_list_payload():
+    path = os.path.join(BASE_DIR, 'output', 'fourgtv.json')
+    with open(path, 'rb') as f:
+        return json.loads(f.read())
+
+
+def bench(fn, repeat):
+    best = float('inf')
+    for _ in range(5):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='JSON 編解碼基準測試')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"epg_json 後端: {epg_json.BACKEND}")
+    print(f"{'負載':<24}{'大小(KB)':>10}{'json(µs)':>12}{'epg_json(µs)':>14}{'加速':>8}")
+
+    decode_cases = [
+        ("Hami 單日解碼", hami_payload()),
+        ("4gtv ProgList 解碼", fourgtv_payload()),
+        ("ofiii __NEXT_DATA__ 解碼", ofiii_payload()),
+    ]
+    for name, obj in decode_cases:
+        raw = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        text = raw.decode('utf-8')
+        base = bench(lambda: json.loads(text), args.repeat)
+        fast = bench(lambda: epg_json.loads(raw), args.repeat)
+        print(f"{name:<24}{len(raw) / 1024:>10.1f}{base:>12.1f}{fast:>14.1f}{base / fast:>7.1f}x")
+
+    channels = channel_list_payload()
+    size = len(json.dumps(channels, ensure_ascii=False, indent=2).encode('utf-8'))
+    base = bench(lambda: json.dumps(channels, ensure_ascii=False, indent=2), args.repeat)
+    fast = bench(lambda: epg_json.dumps(channels, indent=True), args.repeat)
+    print(f"{'fourgtv.json 編碼':<24}{size / 1024:>10.1f}{base:>12.1f}{fast:>14.1f}{base / fast:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""節目整理基準測試：分組後合併已排序段落 vs 逐頻道掃描並重新排序
+
+建立 --channels 個頻道、每頻道 --days 個逐日有序列表（每 30 分鐘一個節目，
+跨日節目在前後兩天重複出現，即 Hami 回傳的形態），比較:
+  - 原做法: 每個頻道從全部節目中篩選後 sort
+  - epg_normalize: 一次分組，各頻道以 heapq.merge 合併逐日段落並整理
+
+用法: python benchmarks/bench_normalize.py [--channels 200] [--days 7]
+"""
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import epg_normalize
+from epg_parse_pool import TAIPEI_TZ
+
+SLOT = timedelta(minutes=30)
+
+
+def build(channels, days):
+    base = TAIPEI_TZ.localize(datetime(2026, 10, 19))
+    programs = []
+    for c in range(channels):
+        for d in range(days):
+            day_start = base + timedelta(days=d)
+            # 前一天最後一個節目跨入當天
+            start = day_start - SLOT / 2 if d else day_start
+            while start < day_start + timedelta(days=1):
+                programs.append({
+                    "channelId": f"pk{c}", "channelName": f"頻道{c}", "programName": "節目",
+                    "description": "", "subtitle": "", "start": start, "end": start + SLOT
+                })
+                start += SLOT
+    return programs
+
+
+def baseline(channel_ids, programs):
+    result = []
+    for channel_id in channel_ids:
+        channel_programs = [p for p in programs if p["channelId"] == channel_id]
+        channel_programs.sort(key=lambda p: p["start"])
+        result.append(channel_programs)
+    return result
+
+
+def normalized(channel_ids, programs):
+    groups = epg_normalize.group_by(programs, "channelId")
+    return [epg_normalize.normalize(groups.get(channel_id, [])) for channel_id in channel_ids]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='節目整理基準測試')
+    parser.add_argument('--channels', type=int, default=200)
+    parser.add_argument('--days', type=int, default=7)
+    args = parser.parse_args()
+
+    programs = build(args.channels, args.days)
+    channel_ids = [f"pk{c}" for c in range(args.channels)]
+    print(f"{args.channels} 個頻道, {len(programs)} 個節目")
+
+    for name, fn in (('篩選+排序', baseline), ('分組+合併整理', normalized)):
+        t0 = time.perf_counter()
+        result = fn(channel_ids, programs)
+        elapsed = time.perf_counter() - t0
+        print(f"{name:<10} {elapsed * 1000:9.1f} ms  輸出 {sum(len(r) for r in result)} 個節目")
+
+
+if __name__ == '__main__':
+    main()
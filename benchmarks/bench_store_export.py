@@ -0,0 +1,96 @@
+"""節目資料庫匯出基準測試：從 30 天歷史中匯出 24 小時的 XMLTV
+
+建立 --channels 個頻道、每 30 分鐘一個節目、共 --days 天的臨時資料庫，
+比較兩種匯出方式的耗時與 Python 記憶體峰值:
+  - 全量載入: 讀出全部節目後在記憶體中過濾
+  - 索引匯出: ProgrammeStore.export_xmltv 逐頻道範圍查詢並串流寫出
+
+用法: python benchmarks/bench_store_export.py [--channels 120] [--days 30]
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+from epg_store import ProgrammeStore
+
+DESC = "每周一到周五播出全國第一名八點檔大戲，除了優質節目，也可以隨時掌握最新最重要的國內外大事與最權威的觀點。"
+SLOT = 1800
+
+
+def build(store, channels, days, start):
+    store.upsert_channels('bench', [(f"頻道{i}", f"頻道{i}", None) for i in range(channels)])
+    slots = days * 86400 // SLOT
+
+    def rows():
+        for i in range(channels):
+            for n in range(slots):
+                t = start + n * SLOT
+                yield (f"頻道{i}", t, t + SLOT, f"節目{n % 50}", DESC, "")
+
+    return store.upsert_programmes('bench', rows())
+
+
+def measure(fn):
+    """分別量測耗時與記憶體峰值（tracemalloc 本身會拖慢執行）"""
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='節目資料庫匯出基準測試')
+    parser.add_argument('--channels', type=int, default=120)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    history_start = 1754006400  # 2025-08-01 08:00 +0800
+    window_start = history_start + (args.days - 2) * 86400
+    window_end = window_start + 86400
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'epg.db')
+        with ProgrammeStore(db_path) as store:
+            t0 = time.perf_counter()
+            count = build(store, args.channels, args.days, history_start)
+            print(f"建立資料庫: {count} 個節目, {time.perf_counter() - t0:.2f}秒, "
+                  f"{os.path.getsize(db_path) / 1024 / 1024:.1f} MB")
+
+            def load_all():
+                rows = store.conn.execute(
+                    "SELECT channel, start, stop, title, desc, subtitle FROM programmes"
+                ).fetchall()
+                return len([r for r in rows if r[1] < window_end and r[2] > window_start])
+
+            def export_slice():
+                return store.export_xmltv(
+                    os.path.join(tmp, 'slice.xml'), source='bench', start=window_start, end=window_end
+                )[1]
+
+            def export_channel():
+                return store.export_xmltv(
+                    os.path.join(tmp, 'one.xml'), source='bench', channels=["頻道7"],
+                    start=window_start, end=window_end
+                )[1]
+
+            for name, fn in [
+                ("全量載入後過濾 (未寫檔)", load_all),
+                ("索引匯出 24h 全部頻道", export_slice),
+                ("索引匯出 24h 單一頻道", export_channel),
+            ]:
+                result, elapsed, peak = measure(fn)
+                print(f"{name:<22} {result:>7} 個節目  {elapsed * 1000:>9.1f} ms  峰值 {peak / 1024 / 1024:>7.2f} MB")
+
+
+if __name__ == '__main__':
+    main()
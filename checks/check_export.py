@@ -0,0 +1,115 @@
+"""精簡匯出格式的往返檢查：寫出 .jsonl/.epgb 後以讀取器讀回，逐頻道比對內容
+
+涵蓋:
+  - 多頻道、重複的節目名稱與描述（.epgb 字串表只存一次）
+  - 沒有節目的頻道、空白描述、非 ASCII 字串
+  - 完全沒有節目的匯出
+  - group_rows 按頻道清單順序分組並忽略不在清單中的節目
+
+任一檢查不符時以 AssertionError 結束並返回非零狀態。
+
+用法: python checks/check_export.py
+"""
+import os
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import epg_export
+
+BASE = 1792339200  # 2026-10-19 00:00 台北時間
+
+
+def sample_groups():
+    return [
+        ("民視", [
+            (BASE, BASE + 1800, "民視晚間新聞", "國內外大事"),
+            (BASE + 1800, BASE + 3600, "市井豪門", ""),
+            (BASE + 3600, BASE + 5400, "民視晚間新聞", "國內外大事"),
+        ]),
+        ("空頻道", []),
+        ("HBO", [
+            (BASE, BASE + 7200, "Movie & \"Quotes\" <1>", "line1\nline2"),
+        ]),
+    ]
+
+
+def read_jsonl(path, channel_ids):
+    with epg_export.JsonlReader(path) as reader:
+        assert reader.channels() == channel_ids, reader.channels()
+        return [
+            (channel_id, [(p["start"], p["stop"], p["title"], p["desc"]) for p in reader.programmes(channel_id)])
+            for channel_id in channel_ids
+        ]
+
+
+def read_binary(path, channel_ids):
+    with epg_export.BinaryReader(path) as reader:
+        assert reader.channels() == channel_ids, reader.channels()
+        return [(channel_id, reader.programmes(channel_id)) for channel_id in channel_ids]
+
+
+def check_round_trip(directory, name, groups):
+    channel_ids = [channel_id for channel_id, _ in groups]
+    expected = [(channel_id, list(programs)) for channel_id, programs in groups]
+    total = sum(len(programs) for _, programs in groups)
+
+    jsonl_path = os.path.join(directory, name + '.jsonl')
+    assert epg_export.write_jsonl(groups, jsonl_path) == total
+    assert read_jsonl(jsonl_path, channel_ids) == expected
+
+    binary_path = os.path.join(directory, name + '.epgb')
+    assert epg_export.write_binary(groups, binary_path) == total
+    assert read_binary(binary_path, channel_ids) == expected
+
+    print(f"{name}: {len(groups)} 個頻道, {total} 個節目 往返一致")
+
+
+def check_string_table(directory):
+    groups = sample_groups()
+    path = os.path.join(directory, 'strings.epgb')
+    epg_export.write_binary(groups, path)
+
+    expected = {channel_id for channel_id, _ in groups}
+    for _, programs in groups:
+        for _, _, title, desc in programs:
+            expected.update((title, desc))
+
+    with open(path, 'rb') as f:
+        n_strings = epg_export.HEADER.unpack(f.read(epg_export.HEADER.size))[4]
+    with epg_export.BinaryReader(path) as reader:
+        strings = [reader.string(i) for i in range(n_strings)]
+    assert sorted(strings) == sorted(expected), strings
+    print(f"字串表: {n_strings} 個字串，重複的名稱與描述只存一次")
+
+
+def check_group_rows():
+    rows = [
+        ("B", BASE, BASE + 60, "b1", None),
+        ("X", BASE, BASE + 60, "ignored", ""),
+        ("A", BASE, BASE + 60, "a1", "d"),
+        ("B", BASE + 60, BASE + 120, "b2", ""),
+    ]
+    groups = epg_export.group_rows(["A", "B", "A", "C"], rows)
+    assert groups == [
+        ("A", [(BASE, BASE + 60, "a1", "d")]),
+        ("B", [(BASE, BASE + 60, "b1", ""), (BASE + 60, BASE + 120, "b2", "")]),
+        ("C", []),
+    ], groups
+    print("group_rows: 按頻道清單分組並忽略未知頻道")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        check_round_trip(directory, 'sample', sample_groups())
+        check_round_trip(directory, 'empty', [])
+        check_round_trip(directory, 'no-programs', [("民視", []), ("台視", [])])
+        check_string_table(directory)
+    check_group_rows()
+    print("全部檢查通過")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""節目整理的邊界檢查：零長度、重複、重疊、空檔與亂序段落
+
+每項檢查以小型節目列表呼叫 epg_normalize.normalize，比對輸出的節目與統計數量；
+另檢查 normalize_programs 逐頻道分組、保留頻道順序，且不修改原始節目字典。
+任一檢查不符時以 AssertionError 結束並返回非零狀態。
+
+用法: python checks/check_normalize.py
+"""
+import os
+import sys
+from collections import Counter
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'scripts'))
+
+import epg_normalize
+from epg_parse_pool import TAIPEI_TZ
+
+BASE = TAIPEI_TZ.localize(datetime(2026, 10, 19))
+
+
+def program(title, start, end, channel="民視"):
+    """以相對 BASE 的小時數建立節目"""
+    return {
+        "channelName": channel, "programName": title, "description": "", "subtitle": "",
+        "start": BASE + timedelta(hours=start), "end": BASE + timedelta(hours=end)
+    }
+
+
+def summary(programs):
+    """返回 [(名稱, 開始小時, 結束小時)] 便於比對"""
+    hour = timedelta(hours=1)
+    return [(p["programName"], (p["start"] - BASE) / hour, (p["end"] - BASE) / hour) for p in programs]
+
+
+def run(programs, fill_gaps=False):
+    stats = Counter()
+    return summary(epg_normalize.normalize(programs, fill_gaps, stats)), stats
+
+
+def check_empty():
+    assert epg_normalize.normalize([]) == []
+    assert epg_normalize.normalize_programs([], "channelName") == []
+    print("空列表: 返回空列表")
+
+
+def check_zero_length():
+    result, stats = run([program("a", 0, 1), program("零長度", 1, 1), program("倒置", 3, 2), program("b", 1, 2)])
+    assert result == [("a", 0, 1), ("b", 1, 2)], result
+    assert stats == Counter(zero_length=2), stats
+    print("零長度: 刪除零長度與結束早於開始的節目")
+
+
+def check_duplicate():
+    # 跨日節目在前後兩天的列表中各出現一次
+    day1 = [program("a", 20, 22), program("跨日", 22, 25)]
+    day2 = [program("跨日", 22, 25), program("b", 25, 26)]
+    result, stats = run(day1 + day2)
+    assert result == [("a", 20, 22), ("跨日", 22, 25), ("b", 25, 26)], result
+    assert stats == Counter(duplicate=1), stats
+    print("重複: 相同開始時間只保留第一個節目")
+
+
+def check_overlap():
+    original = program("a", 0, 3)
+    result, stats = run([original, program("b", 2, 4), program("c", 4, 5)])
+    assert result == [("a", 0, 2), ("b", 2, 4), ("c", 4, 5)], result
+    assert stats == Counter(trimmed=1), stats
+    # 截短的節目為副本，原始字典不變
+    assert original["end"] == BASE + timedelta(hours=3)
+    print("重疊: 前一個節目截至下一個節目開始，不修改原始字典")
+
+
+def check_gap():
+    programs = [program("a", 0, 1), program("b", 2, 3), program("c", 3, 4)]
+    result, stats = run(programs)
+    assert result == [("a", 0, 1), ("b", 2, 3), ("c", 3, 4)], result
+    assert not stats, stats
+
+    result, stats = run(programs, fill_gaps=True)
+    filler = epg_normalize.FILLER_TITLE
+    assert result == [("a", 0, 1), (filler, 1, 2), ("b", 2, 3), ("c", 3, 4)], result
+    assert stats == Counter(filled=1), stats
+    print("空檔: 默認保留空檔，--fill-gaps 時填補佔位節目")
+
+
+def check_unsorted_runs():
+    # 逐日列表以任意順序串接，每天為一個已排序段落
+    day0 = [program("x", -2, 0)]
+    day1 = [program("a", 0, 2), program("b", 2, 5), program("c", 4, 6)]
+    day2 = [program("d", 23, 25), program("e", 25, 26)]
+    assert len(epg_normalize.split_runs(day2 + day1 + day0)) == 3
+    result, stats = run(day2 + day1 + day0)
+    assert result == [("x", -2, 0), ("a", 0, 2), ("b", 2, 4), ("c", 4, 6), ("d", 23, 25), ("e", 25, 26)], result
+    assert stats == Counter(trimmed=1), stats
+    print("亂序段落: 合併後按開始時間排序")
+
+
+def check_channels():
+    programs = [
+        program("b1", 1, 2, "台視"),
+        program("a1", 0, 1, "民視"),
+        program("b0", 0, 1, "台視"),
+        program("a1", 0, 1, "民視"),
+    ]
+    result = epg_normalize.normalize_programs(programs, "channelName")
+    assert [(p["channelName"], p["programName"]) for p in result] == [
+        ("台視", "b0"), ("台視", "b1"), ("民視", "a1")
+    ], result
+    print("多頻道: 逐頻道整理並保留頻道第一次出現的順序")
+
+
+def main():
+    check_empty()
+    check_zero_length()
+    check_duplicate()
+    check_overlap()
+    check_gap()
+    check_unsorted_runs()
+    check_channels()
+    print("全部檢查通過")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,19 @@
 import asyncio
+import argparse
 import os
 import pytz
 import requests
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
 from loguru import logger
+import epg_json
+import epg_logging
+import epg_export
+import epg_normalize
+import epg_profile
+import epg_shard
+from epg_profile import phase
+from epg_store import ProgrammeStore, program_rows
 
 UA = "HamiVideo/7.12.806(Android 11;GM1910) OKHTTP/3.12.2"
 headers = {
@@ -17,7 +26,17 @@ REQUEST_TIMEOUT = 30
 MAX_RETRIES = 3
 RETRY_DELAY = 10
 
-async def request_channel_list():
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+HORIZON_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'output', 'hami_horizon.json')
+# 未知頻道的預設請求天數，以及向後探測的最大天數
+DEFAULT_DAYS = 7
+MAX_DAYS = 14
+# 頻道距上次向後探測超過這麼多天時，探測一次以發現延長的節目表
+PROBE_EVERY = 7
+# 窗口最後一天的節目結束時間早於當日結束超過此時長時，視為節目表未發佈完整，向後探測
+SHORT_DAY_MARGIN = timedelta(hours=2)
+
+async def request_channel_list(session=None):
     params = {
         "appVersion": "7.12.806",
         "deviceType": "1",
@@ -28,9 +47,9 @@ async def request_channel_list():
     url = "https://apl-hamivideo.cdn.hinet.net/HamiVideo/getUILayoutById.php"
     channel_list = []
     try:
-        response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        response = (session or requests).get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
         if response.status_code == 200:
-            data = response.json()
+            data = epg_json.loads(response.content)
             elements = []
 
             for info in data.get("UIInfo", []):
@@ -45,89 +64,230 @@ async def request_channel_list():
                     "contentPk": element.get('contentPk', '')
                 })
     except Exception as e:
-        print(f"獲取頻道列表時出錯: {e}")
+        logger.error(f"獲取頻道列表時出錯: {e}")
     
     return channel_list
 
-async def get_programs_with_retry(channel):
+def channel_key(channel):
+    """分片與合併使用的頻道鍵"""
+    return channel['contentPk']
+
+async def get_programs_with_retry(channel, session=None, horizon=None):
     retries = 0
 
     while retries < MAX_RETRIES:
         try:
-            programs = await request_epg(channel['channelName'], channel['contentPk'])
+            programs = await request_epg(channel['channelName'], channel['contentPk'], session, horizon)
             return programs
         except Exception as e:
             retries += 1
-            print(f"請求 {channel['channelName']} 的EPG時出錯: {e}")
-            print(f"將在 {RETRY_DELAY} 秒後重試 ({retries}/{MAX_RETRIES})")
+            logger.error(f"請求 {channel['channelName']} 的EPG時出錯: {e}")
+            logger.info(f"將在 {RETRY_DELAY} 秒後重試 ({retries}/{MAX_RETRIES})")
             await asyncio.sleep(RETRY_DELAY)
     
     logger.warning(f"{channel['channelName']} 達到最大重試次數，跳過...")
     return []
 
-async def request_all_epg():
-    print("開始獲取頻道列表...")
-    rawChannels = await request_channel_list()
-    print(f"找到 {len(rawChannels)} 個頻道")
+async def request_all_epg(horizon=None, shard=None):
+    logger.info("開始獲取頻道列表...")
+    with phase('discovery'):
+        rawChannels = await request_channel_list()
+        if shard:
+            rawChannels = shard.select(rawChannels, channel_key)
+    logger.info(f"找到 {len(rawChannels)} 個頻道")
     
     all_programs = []
     
+    progress = epg_logging.ProgressReporter('hami', len(rawChannels))
+    
+    async def fetch_channel(channel):
+        programs = await get_programs_with_retry(channel, horizon=horizon)
+        if programs:
+            progress.success(channel['channelName'], len(programs))
+        else:
+            progress.failure(channel['channelName'], "沒有節目資料")
+        return programs
+    
     # 使用asyncio.gather並行獲取所有頻道的節目
     tasks = []
     for channel in rawChannels:
-        tasks.append(get_programs_with_retry(channel))
+        tasks.append(fetch_channel(channel))
+    
+    # 節目表的解析在各請求中同步完成，計入 fetch 階段
+    with phase('fetch'):
+        results = await asyncio.gather(*tasks)
+    progress.finish()
     
-    results = await asyncio.gather(*tasks)
+    if horizon is not None:
+        horizon.log_summary(len(rawChannels))
     
     for programs in results:
         if programs:
             all_programs.extend(programs)
     
-    print(f"共獲取 {len(all_programs)} 個節目")
+    logger.info(f"共獲取 {len(all_programs)} 個節目")
     return rawChannels, all_programs
 
-async def request_epg(channel_name: str, content_pk: str):
+async def request_epg_day(channel_name: str, content_pk: str, date, session=None):
+    """獲取單一日期的節目表，該日沒有節目時返回空列表，請求失敗時返回None"""
     url = "https://apl-hamivideo.cdn.hinet.net/HamiVideo/getEpgByContentIdAndDate.php"
-    print(f"獲取 {channel_name} 的節目表...")
+    formatted_date = date.strftime('%Y-%m-%d')
+    params = {
+        "deviceType": "1",
+        "Date": formatted_date,
+        "contentPk": content_pk,
+    }
+    
+    epgResult = []
+    try:
+        response = (session or requests).get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        if response.status_code != 200:
+            logger.error(f"獲取 {channel_name} 在 {formatted_date} 的節目表時出錯: HTTP {response.status_code}")
+            return None
+        
+        data = epg_json.loads(response.content)
+        ui_info = data.get('UIInfo', [])
+        if ui_info:
+            elements = ui_info[0].get('elements', [])
+            for element in elements:
+                program_info_list = element.get('programInfo', [])
+                if program_info_list:
+                    program_info = program_info_list[0]
+                    start_time, end_time = hami_time_to_datetime(program_info['hintSE'])
+                    
+                    epgResult.append({
+                        "channelId": content_pk,
+                        "channelName": element.get('title', ''),
+                        "programName": program_info.get('programName', ''),
+                        "description": program_info.get('description', ''),
+                        "start": start_time,
+                        "end": end_time
+                    })
+    except Exception as e:
+        logger.error(f"獲取 {channel_name} 在 {formatted_date} 的節目表時出錯: {e}")
+        return None
+    
+    return epgResult
+
+def is_short_day(programs, date):
+    """該日最後一個節目的結束時間是否明顯早於當日結束"""
+    day_end = TAIPEI_TZ.localize(datetime.combine(date + timedelta(days=1), datetime.min.time()))
+    return max(p["end"] for p in programs) < day_end - SHORT_DAY_MARGIN
+
+async def request_epg(channel_name: str, content_pk: str, session=None, horizon=None):
+    """獲取頻道節目表
+
+    未傳入 horizon 時固定請求 DEFAULT_DAYS 天；傳入時只請求頻道窗口內的日期
+    （今天起 window 天），需要探測時才逐日向後請求，直到遇到空白日期或達到 MAX_DAYS。
+    """
+    logger.debug(f"獲取 {channel_name} 的節目表...")
     
     epgResult = []
-    today = datetime.now(pytz.timezone('Asia/Taipei'))
+    today = datetime.now(TAIPEI_TZ).date()
+    
+    if horizon is None:
+        for i in range(DEFAULT_DAYS):
+            programs = await request_epg_day(channel_name, content_pk, today + timedelta(days=i), session)
+            if programs:
+                epgResult.extend(programs)
+        return epgResult
     
-    for i in range(7):
+    window, probe = horizon.plan(content_pk, today)
+    days = max(window, 1)
+    last_index = -1
+    failed = False
+    
+    for i in range(MAX_DAYS):
+        # 超出窗口後，只在需要探測且前一天有節目時才繼續
+        if i >= days and (not probe or last_index != i - 1):
+            break
+        
         date = today + timedelta(days=i)
-        formatted_date = date.strftime('%Y-%m-%d')
-        params = {
-            "deviceType": "1",
-            "Date": formatted_date,
-            "contentPk": content_pk,
-        }
+        programs = await request_epg_day(channel_name, content_pk, date, session)
+        horizon.requests += 1
         
-        try:
-            response = requests.get(url, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
-            if response.status_code == 200:
-                data = response.json()
-                ui_info = data.get('UIInfo', [])
-                if ui_info:
-                    elements = ui_info[0].get('elements', [])
-                    for element in elements:
-                        program_info_list = element.get('programInfo', [])
-                        if program_info_list:
-                            program_info = program_info_list[0]
-                            start_time, end_time = hami_time_to_datetime(program_info['hintSE'])
-                            
-                            epgResult.append({
-                                "channelId": content_pk,
-                                "channelName": element.get('title', ''),
-                                "programName": program_info.get('programName', ''),
-                                "description": program_info.get('description', ''),
-                                "start": start_time,
-                                "end": end_time
-                            })
-        except Exception as e:
-            print(f"獲取 {channel_name} 在 {formatted_date} 的節目表時出錯: {e}")
+        if programs is None:
+            failed = True
+            if i >= days:
+                break
+        elif programs:
+            horizon.productive += 1
+            epgResult.extend(programs)
+            last_index = i
+            # 窗口最後一天不完整時，下一天可能已開始發佈
+            if i == days - 1 and is_short_day(programs, date):
+                probe = True
+        elif i >= days:
+            # 已超出窗口且該日無節目，停止探測
+            break
     
+    horizon.update(content_pk, last_index + 1, failed, probe, today)
     return epgResult
 
+class Horizon:
+    """記錄各頻道節目表的窗口長度（今天起有節目的天數），跨次執行保存於 JSON 檔案
+
+    節目表通常是以今天為起點的滾動窗口，因此記錄的是天數而非絕對日期：
+    每次執行只請求今天起 window 天，窗口最後一天沒有節目時窗口隨之縮短。
+    只有在窗口最後一天不完整，或距上次探測已達 PROBE_EVERY 天時，才向後探測窗口之外的日期。
+    記錄的是上次探測的日期而非執行次數，窗口穩定的頻道在兩次探測之間檔案內容不變，
+    workflow 不會因此每次都產生提交。
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.windows = {}
+        self.requests = 0
+        self.productive = 0
+        
+        if os.path.exists(path):
+            try:
+                data = epg_json.load_file(path)
+                today = datetime.now(TAIPEI_TZ).date()
+                for pk, value in data.items():
+                    if isinstance(value, str):
+                        # 舊格式記錄最遠日期，轉換為窗口並於本次執行探測
+                        last_date = datetime.strptime(value, '%Y-%m-%d').date()
+                        value = {"window": max((last_date - today).days + 1, 0), "probed": None}
+                    self.windows[pk] = value
+            except Exception as e:
+                logger.warning(f"讀取節目日期範圍檔案失敗，將重新探測: {e}")
+    
+    def plan(self, content_pk, today):
+        """返回 (窗口天數, 是否向後探測)；未記錄的頻道請求 DEFAULT_DAYS 天並探測"""
+        entry = self.windows.get(content_pk)
+        if entry is None:
+            return DEFAULT_DAYS, True
+        probed = entry.get("probed")
+        due = probed is None or (today - datetime.strptime(probed, '%Y-%m-%d').date()).days >= PROBE_EVERY
+        return entry["window"], due
+    
+    def update(self, content_pk, window, failed, probed, today):
+        """記錄頻道窗口與上次探測日期；有請求失敗時只延伸、不縮短"""
+        entry = self.windows.get(content_pk)
+        if failed and entry and window < entry["window"]:
+            window = entry["window"]
+        last_probed = today.strftime('%Y-%m-%d') if probed else (entry or {}).get("probed")
+        self.windows[content_pk] = {"window": window, "probed": last_probed}
+    
+    def log_summary(self, channel_count):
+        """輸出本次請求數與相對固定 DEFAULT_DAYS 天請求的實際節省"""
+        baseline = DEFAULT_DAYS * channel_count
+        saved = baseline - self.requests
+        ratio = saved / baseline * 100 if baseline else 0
+        logger.info(
+            f"節目表請求數: {self.requests} (有節目 {self.productive}, 空白或失敗 {self.requests - self.productive}), "
+            f"較每頻道固定 {DEFAULT_DAYS} 天的 {baseline} 次{'節省' if saved >= 0 else '增加'} {abs(saved)} 次 ({abs(ratio):.1f}%)"
+        )
+    
+    def export(self, content_pks=None):
+        """返回 {contentPk: {"window", "probed"}}，可只取指定頻道"""
+        pks = sorted(self.windows) if content_pks is None else sorted(set(content_pks) & set(self.windows))
+        return {pk: self.windows[pk] for pk in pks}
+    
+    def save(self):
+        epg_json.dump_file(self.export(), self.path, indent=True)
+
 def hami_time_to_datetime(time_range: str):
     start_time_str, end_time_str = time_range.split('~')
     start_time = datetime.strptime(start_time_str, "%Y-%m-%d %H:%M:%S")
@@ -137,15 +297,19 @@ def hami_time_to_datetime(time_range: str):
     end_time_shanghai = shanghai_tz.localize(end_time)
     return start_time_shanghai, end_time_shanghai
 
+def normalize_programs(programs):
+    """逐頻道合併逐日節目列表並整理，生成XML、匯出與寫入資料庫前各執行一次"""
+    return epg_normalize.normalize_programs(programs, "channelId")
+
 def generate_xml_epg(channels, programs):
+    """programs 須已經 normalize_programs 整理"""
     # 建立XML結構
     root = ET.Element("tv")
     root.set("info-name", "Hami電視節目表")
     root.set("info-url", "https://hamivideo.hinet.net/")
     
-    channel_name_map = {}
-    for channel in channels:
-        channel_name_map[channel["contentPk"]] = channel["channelName"]
+    # 一次分組，各頻道的節目已由 normalize_programs 排序整理
+    programs_by_channel = epg_normalize.group_by(programs, "channelId")
     
     # 按頻道順序處理
     for channel in channels:
@@ -159,15 +323,7 @@ def generate_xml_epg(channels, programs):
         display_name = ET.SubElement(channel_elem, "display-name")
         display_name.text = channel["channelName"]
         
-        channel_programs = [
-            p for p in programs 
-            if p["channelId"] == channel["contentPk"]
-        ]
-        
-        # 按開始時間排序
-        channel_programs.sort(key=lambda p: p["start"])
-        
-        for program in channel_programs:
+        for program in programs_by_channel.get(channel["contentPk"], []):
             programme = ET.SubElement(root, "programme")
             programme.set("start", program["start"].strftime("%Y%m%d%H%M%S %z"))
             programme.set("stop", program["end"].strftime("%Y%m%d%H%M%S %z"))
@@ -186,8 +342,29 @@ def generate_xml_epg(channels, programs):
     tree = ET.ElementTree(root)
     return tree
 
-async def main():
-    print("開始生成Hami電視節目表...")
+def save_to_store(db_path, channels, programs):
+    """將頻道與節目寫入節目資料庫"""
+    channel_names = {channel["contentPk"]: channel["channelName"] for channel in channels}
+    with ProgrammeStore(db_path) as store:
+        store.upsert_channels('hami', [
+            (channel["channelName"], channel["channelName"], None)
+            for channel in channels
+        ])
+        count = store.upsert_programmes(
+            'hami', program_rows(programs, lambda p: channel_names.get(p["channelId"], p["channelName"]))
+        )
+    logger.info(f"已寫入節目資料庫: {db_path} ({count} 個節目)")
+
+def export_compact(base_path, formats, channels, programs):
+    """輸出精簡格式"""
+    channel_names = {channel["contentPk"]: channel["channelName"] for channel in channels}
+    channel_ids = [channel["channelName"] for channel in channels]
+    rows = program_rows(programs, lambda p: channel_names.get(p["channelId"], p["channelName"]))
+    for path in epg_export.export(base_path, formats, channel_ids, rows):
+        logger.info(f"精簡格式已生成: {path}")
+
+async def main(store_path=None, horizon_file=None, export_formats=None, shard=None):
+    logger.info("開始生成Hami電視節目表...")
     
     # 建立輸出目錄
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -195,20 +372,65 @@ async def main():
     output_dir = os.path.join(project_root, "output")
     os.makedirs(output_dir, exist_ok=True)
     
-    print(f"輸出目錄: {output_dir}")
+    logger.info(f"輸出目錄: {output_dir}")
     
     # 獲取頻道和節目數據
-    channels, programs = await request_all_epg()
+    horizon = Horizon(horizon_file) if horizon_file else None
+    channels, programs = await request_all_epg(horizon, shard)
+    
+    if shard:
+        # 分片模式只寫出部分結果，日期範圍記錄與XML都由 epg_shard.py merge 統一寫出
+        extra = {}
+        if horizon is not None:
+            extra = {"horizon_file": horizon.path, "horizon": horizon.export(channel_key(c) for c in channels)}
+        epg_shard.write_partial('hami', shard, channels, programs, channel_key, extra)
+        return
+    
+    if horizon is not None:
+        horizon.save()
+    
+    programs = normalize_programs(programs)
     
     # 生成XML EPG
-    xml_tree = generate_xml_epg(channels, programs)
     output_file = os.path.join(output_dir, "hami.xml")
+    with phase('generate'):
+        xml_tree = generate_xml_epg(channels, programs)
+        
+        # 正確寫入XML文件
+        xml_tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    
+    logger.success(f"電視節目表已成功生成: {output_file}")
+    logger.info(f"檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
     
-    # 正確寫入XML文件
-    xml_tree.write(output_file, encoding="utf-8", xml_declaration=True)
+    if export_formats:
+        with phase('export'):
+            export_compact(os.path.splitext(output_file)[0], export_formats, channels, programs)
     
-    print(f"電視節目表已成功生成: {output_file}")
-    print(f"檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
+    if store_path:
+        with phase('store'):
+            save_to_store(store_path, channels, programs)
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    parser = argparse.ArgumentParser(description='Hami電視節目表')
+    parser.add_argument('--store', type=str,
+                        help='同時寫入 SQLite 節目資料庫的路徑 (如 output/epg.db)')
+    parser.add_argument('--horizon-file', type=str, default=HORIZON_FILE,
+                        help='各頻道節目日期範圍的記錄檔 (默認: output/hami_horizon.json)')
+    parser.add_argument('--no-horizon', action='store_true',
+                        help=f'不使用日期範圍記錄，每個頻道固定請求 {DEFAULT_DAYS} 天')
+    epg_export.add_arguments(parser)
+    epg_normalize.add_arguments(parser)
+    epg_profile.add_arguments(parser)
+    epg_logging.add_arguments(parser)
+    epg_shard.add_arguments(parser)
+    args = parser.parse_args()
+    epg_profile.setup('hami', args)
+    epg_normalize.setup(args)
+    epg_logging.setup_logging(args.log_level)
+    
+    try:
+        asyncio.run(main(args.store, None if args.no_horizon else args.horizon_file, args.export, args.shard))
+    finally:
+        profile_path = epg_profile.save()
+        if profile_path:
+            logger.info(f"階段剖析結果已寫入: {profile_path}")
@@ -0,0 +1,178 @@
+"""Cloudflare 通行憑證管理
+
+由第一個通過 Cloudflare 驗證的客戶端（Selenium Chrome 或 cloudscraper）取得
+cookie 與 User-Agent，注入到一般 requests 會話重複使用，並連同到期時間保存到檔案
+供下次執行使用；只有在憑證被拒絕時才重新以 cloudscraper 通過驗證。
+"""
+import os
+import time
+from loguru import logger
+
+import epg_json
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLEARANCE_FILE = os.path.join(BASE_DIR, '.cache', 'cf_clearance.json')
+
+# Cloudflare 通行憑證 cookie 的名稱；其他 cookie（如 __cf_bm 約 30 分鐘）的到期時間與憑證無關
+CLEARANCE_COOKIE = 'cf_clearance'
+# 沒有 cf_clearance 或其未帶到期時間（如未觸發驗證時）假定的有效秒數
+DEFAULT_TTL = 6 * 3600
+
+
+def is_rejected(response):
+    """判斷回應是否為 Cloudflare 驗證頁面"""
+    if response.status_code not in (403, 429, 503):
+        return False
+    if response.headers.get('cf-mitigated') == 'challenge':
+        return True
+    if 'cloudflare' not in response.headers.get('Server', '').lower():
+        return False
+    text = response.text[:4096]
+    return 'cf-chl' in text or 'Just a moment' in text or 'challenge-platform' in text
+
+
+class ClearanceManager:
+    """保存與注入 Cloudflare 通行憑證"""
+
+    def __init__(self, path=CLEARANCE_FILE):
+        self.path = path
+        self.user_agent = None
+        self.cookies = []
+        self.expires = 0
+
+    @property
+    def valid(self):
+        return bool(self.user_agent) and time.time() < self.expires
+
+    def load(self):
+        """讀取保存的憑證，已過期時忽略"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            data = epg_json.load_file(self.path)
+        except Exception as e:
+            logger.warning(f"讀取 Cloudflare 憑證失敗: {e}")
+            return False
+        self.user_agent = data.get('user_agent')
+        self.cookies = data.get('cookies', [])
+        self.expires = data.get('expires', 0)
+        if not self.valid:
+            self.clear()
+            return False
+        logger.info(f"已載入 Cloudflare 憑證，{int(self.expires - time.time())} 秒後到期")
+        return True
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        epg_json.dump_file({
+            'user_agent': self.user_agent,
+            'cookies': self.cookies,
+            'expires': self.expires
+        }, self.path, indent=True)
+
+    def clear(self):
+        self.user_agent = None
+        self.cookies = []
+        self.expires = 0
+
+    def invalidate(self):
+        """憑證被拒絕時清除並刪除保存的檔案"""
+        self.clear()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _set(self, user_agent, cookies):
+        now = time.time()
+        expiries = [c['expires'] for c in cookies if c['name'] == CLEARANCE_COOKIE and c.get('expires')]
+        self.user_agent = user_agent
+        self.cookies = cookies
+        self.expires = max(expiries) if expiries else now + DEFAULT_TTL
+        if self.expires <= now:
+            self.expires = now + DEFAULT_TTL
+        self.save()
+
+    def harvest_from_driver(self, driver):
+        """從已通過驗證的 Selenium 瀏覽器取得憑證"""
+        if self.valid:
+            return
+        try:
+            user_agent = driver.execute_script("return navigator.userAgent")
+            cookies = [
+                {
+                    'name': c['name'],
+                    'value': c['value'],
+                    'domain': c.get('domain', ''),
+                    'path': c.get('path', '/'),
+                    'expires': c.get('expiry')
+                }
+                for c in driver.get_cookies()
+            ]
+        except Exception as e:
+            logger.warning(f"無法從瀏覽器取得 Cloudflare 憑證: {e}")
+            return
+        self._set(user_agent, cookies)
+        logger.info(f"已從瀏覽器取得 Cloudflare 憑證 ({len(cookies)} 個 cookie)")
+
+    def harvest_from_response(self, session, response):
+        """從通過驗證的會話與回應取得憑證，User-Agent 取實際送出的請求標頭"""
+        user_agent = response.request.headers.get('User-Agent') or session.headers.get('User-Agent')
+        cookies = [
+            {
+                'name': c.name,
+                'value': c.value,
+                'domain': c.domain,
+                'path': c.path,
+                'expires': c.expires
+            }
+            for c in session.cookies
+        ]
+        self._set(user_agent, cookies)
+        logger.info(f"已從 cloudscraper 取得 Cloudflare 憑證 ({len(cookies)} 個 cookie)")
+
+    def apply(self, session):
+        """將憑證注入 requests 會話"""
+        session.headers['User-Agent'] = self.user_agent
+        for c in self.cookies:
+            session.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'])
+
+
+class ClearedSession:
+    """先以注入憑證的一般會話請求，被拒絕時才交由 cloudscraper 通過驗證
+
+    介面與 requests.Session.get 相同，可直接取代 cloudscraper 實例。
+    """
+
+    def __init__(self, manager, session, solver_factory):
+        self.manager = manager
+        self.session = session
+        self._solver_factory = solver_factory
+        self._solver = None
+        self.fast = 0
+        self.solved = 0
+
+    @property
+    def solver(self):
+        if self._solver is None:
+            self._solver = self._solver_factory()
+        return self._solver
+
+    def get(self, url, headers=None, **kwargs):
+        headers = dict(headers or {})
+
+        if self.manager.valid:
+            self.manager.apply(self.session)
+            headers['User-Agent'] = self.manager.user_agent
+            response = self.session.get(url, headers=headers, **kwargs)
+            if not is_rejected(response):
+                self.fast += 1
+                return response
+            logger.warning("Cloudflare 憑證被拒絕，重新通過驗證")
+            self.manager.invalidate()
+
+        response = self.solver.get(url, headers=headers, **kwargs)
+        self.solved += 1
+        if not is_rejected(response) and response.ok:
+            self.manager.harvest_from_response(self.solver, response)
+        return response
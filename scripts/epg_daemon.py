@@ -0,0 +1,397 @@
+"""常駐模式：依各頻道剩餘節目時長安排刷新時間
+
+頻道清單、HTTP 連線與已解析的節目表常駐於記憶體中。每個頻道的下次刷新時間
+由該頻道節目表的剩餘時長（horizon）與節目表的變動頻率決定，刷新請求在時間上
+分散執行以避免突發流量；只有節目表實際變動時才重寫輸出檔案。
+
+用法: python scripts/epg_daemon.py --providers hami,4gtv,ofiii
+"""
+import os
+import time
+import heapq
+import random
+import asyncio
+import argparse
+import requests
+from abc import ABC, abstractmethod
+from loguru import logger
+
+import epg_logging
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+
+MIN_INTERVAL = 3600          # 同一頻道最短刷新間隔（秒）
+MAX_INTERVAL = 24 * 3600     # 同一頻道最長刷新間隔（秒）
+LINEUP_INTERVAL = 24 * 3600  # 頻道清單刷新間隔（秒）
+HORIZON_FRACTION = 0.5       # 在剩餘節目時長的此比例處刷新
+CHANGE_WEIGHT = 0.5          # 節目表經常變動的頻道最多提前的比例
+CHANGE_ALPHA = 0.3           # 變動頻率的指數移動平均係數
+JITTER = 0.1                 # 刷新時間的隨機抖動比例
+
+
+def plan_next_refresh(now, horizon_end, change_rate, failures=0,
+                      min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    """計算頻道的下次刷新時間戳
+
+    有節目資料時，在剩餘時長的 HORIZON_FRACTION 處刷新，節目表越常變動越提前；
+    沒有資料或已過期時以 min_interval 為基準按失敗次數指數退避。
+    """
+    remaining = (horizon_end - now) if horizon_end else 0
+    if remaining <= 0:
+        interval = min_interval * (2 ** min(failures, 5))
+    else:
+        interval = remaining * HORIZON_FRACTION * (1 - CHANGE_WEIGHT * change_rate)
+    # 先加入抖動再限制範圍，確保結果不超出 [min_interval, max_interval]
+    interval *= random.uniform(1 - JITTER, 1 + JITTER)
+    interval = max(min_interval, min(max_interval, interval))
+    return now + interval
+
+
+def fingerprint(programs):
+    """節目表指紋，用於判斷刷新後是否有變動"""
+    return hash(tuple(
+        (p["start"], p["end"], p.get("programName"), p.get("description"), p.get("subtitle"))
+        for p in programs
+    ))
+
+
+class ChannelState:
+    """單一頻道的常駐狀態"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.programs = []
+        self.fingerprint = None
+        self.change_rate = 0.5
+        self.failures = 0
+        self.next_refresh = 0
+
+    @property
+    def horizon_end(self):
+        if not self.programs:
+            return None
+        return max(p["end"] for p in self.programs).timestamp()
+
+    def update(self, channel, programs):
+        """套用刷新結果，返回節目表是否有變動"""
+        new_fingerprint = hash((fingerprint(programs), repr(sorted(channel.items()))))
+        changed = new_fingerprint != self.fingerprint
+        if self.fingerprint is not None:
+            self.change_rate += CHANGE_ALPHA * (changed - self.change_rate)
+        self.channel = channel
+        self.programs = programs
+        self.fingerprint = new_fingerprint
+        self.failures = 0
+        return changed
+
+
+class Provider(ABC):
+    """節目表來源：子類別實現頻道清單、單頻道抓取與輸出"""
+
+    name = None
+    output_file = None
+    # 尚未成功抓取的頻道是否仍輸出頻道定義
+    include_unfetched = True
+
+    def __init__(self):
+        self.states = {}
+        self.order = []
+        self.dirty = False
+        self.next_lineup = 0
+
+    @abstractmethod
+    def load_channels(self):
+        """返回頻道清單"""
+
+    @abstractmethod
+    def channel_key(self, channel):
+        """返回頻道的唯一鍵"""
+
+    @abstractmethod
+    def fetch(self, channel):
+        """返回 (頻道資料, 節目列表)，失敗時返回None"""
+
+    @abstractmethod
+    def write(self, channels, programs, path):
+        """將頻道與節目寫入 path"""
+
+    @property
+    def output_path(self):
+        return os.path.join(OUTPUT_DIR, self.output_file)
+
+    def output(self):
+        """重寫輸出檔案（先寫入暫存檔再替換）"""
+        channels, programs = [], []
+        for key in self.order:
+            state = self.states[key]
+            if state.fingerprint is None and not self.include_unfetched:
+                continue
+            channels.append(state.channel)
+            programs.extend(state.programs)
+
+        programs = self.module.normalize_programs(programs)
+        tmp_path = self.output_path + '.tmp'
+        self.write(channels, programs, tmp_path)
+        os.replace(tmp_path, self.output_path)
+        self.dirty = False
+        logger.info(f"[{self.name}] 已重寫 {self.output_path} ({len(channels)} 個頻道, {len(programs)} 個節目)")
+
+
+class HamiProvider(Provider):
+    name = 'hami'
+    output_file = 'hami.xml'
+
+    def __init__(self):
+        super().__init__()
+        import Hami
+        self.module = Hami
+        self.session = requests.Session()
+        # 與排程執行共用窗口記錄，逐頻道刷新時同樣只請求窗口內的日期
+        self.horizon = Hami.Horizon(Hami.HORIZON_FILE)
+
+    def load_channels(self):
+        return asyncio.run(self.module.request_channel_list(self.session))
+
+    def channel_key(self, channel):
+        return channel["contentPk"]
+
+    def fetch(self, channel):
+        programs = asyncio.run(self.module.get_programs_with_retry(channel, self.session, self.horizon))
+        return (channel, programs) if programs else None
+
+    def write(self, channels, programs, path):
+        tree = self.module.generate_xml_epg(channels, programs)
+        tree.write(path, encoding="utf-8", xml_declaration=True)
+
+    def output(self):
+        super().output()
+        self.horizon.save()
+
+
+class FourgtvProvider(Provider):
+    name = '4gtv'
+    output_file = '4g.xml'
+
+    def __init__(self):
+        super().__init__()
+        import fourgtv_epg
+        from epg_clearance import ClearanceManager, ClearedSession
+        self.module = fourgtv_epg
+        self.clearance = ClearanceManager()
+        self.clearance.load()
+        self.scraper = ClearedSession(
+            self.clearance, fourgtv_epg.create_session(), fourgtv_epg.create_cloudscraper
+        )
+
+    def load_channels(self):
+        return self.module.get_4gtv_channels(self.clearance)
+
+    def channel_key(self, channel):
+        return channel["channelId"]
+
+    def fetch(self, channel):
+        programs = self.module.get_4gtv_programs_scraper(
+            channel["channelId"], channel["channelName"], self.scraper
+        )
+        return (channel, programs) if programs else None
+
+    def write(self, channels, programs, path):
+        self.module.generate_xml(channels, programs, path)
+
+
+class OfiiiProvider(Provider):
+    name = 'ofiii'
+    output_file = 'ofiii.xml'
+    # 與 ofiii_epg.py 相同，未成功獲取的頻道不輸出
+    include_unfetched = False
+
+    def __init__(self):
+        super().__init__()
+        import ofiii_epg
+        self.module = ofiii_epg
+        self.session = requests.Session()
+
+    def load_channels(self):
+        return [
+            {"channelName": name, "id": channel_id}
+            for name, channel_id in self.module.parse_channel_list()
+        ]
+
+    def channel_key(self, channel):
+        return channel["id"]
+
+    def fetch(self, channel):
+        return self.module.get_channel_epg(channel["channelName"], channel["id"], self.session)
+
+    def write(self, channels, programs, path):
+        if not self.module.generate_xmltv(channels, programs, path):
+            raise IOError(f"無法寫入 {path}")
+
+
+PROVIDERS = {
+    'hami': HamiProvider,
+    '4gtv': FourgtvProvider,
+    'ofiii': OfiiiProvider,
+}
+
+
+class Daemon:
+    """常駐排程器：以最小堆按到期時間依序刷新各頻道"""
+
+    def __init__(self, providers, spacing=2.0, warmup=600, write_interval=300,
+                 min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        self.providers = providers
+        self.spacing = spacing
+        self.warmup = warmup
+        self.write_interval = write_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queue = []
+        self.seq = 0
+        self.last_write = {}
+
+    def schedule(self, provider, key, when):
+        self.seq += 1
+        provider.states[key].next_refresh = when
+        heapq.heappush(self.queue, (when, self.seq, provider.name, key))
+
+    def refresh_lineup(self, provider, now):
+        """刷新頻道清單，新頻道在 warmup 時間內均勻分散首次抓取"""
+        provider.next_lineup = now + LINEUP_INTERVAL
+        try:
+            channels = provider.load_channels()
+        except Exception as e:
+            logger.error(f"[{provider.name}] 獲取頻道清單失敗: {e}")
+            channels = []
+        if not channels:
+            # 保留現有清單，稍後重試
+            provider.next_lineup = now + self.min_interval
+            return
+
+        order = [provider.channel_key(channel) for channel in channels]
+        removed = set(provider.states) - set(order)
+        added = [(key, channel) for key, channel in zip(order, channels) if key not in provider.states]
+        for key in removed:
+            del provider.states[key]
+        if provider.include_unfetched:
+            # 頻道資料來自清單本身（如 logo），隨清單更新
+            for key, channel in zip(order, channels):
+                if key in provider.states:
+                    provider.states[key].channel = channel
+        for idx, (key, channel) in enumerate(added):
+            provider.states[key] = ChannelState(channel)
+            offset = self.warmup * idx / max(len(added), 1)
+            self.schedule(provider, key, now + offset + random.uniform(0, self.spacing))
+
+        if removed or order != provider.order:
+            provider.dirty = True
+        provider.order = order
+        logger.info(f"[{provider.name}] 頻道清單: {len(order)} 個頻道 (新增 {len(added)}, 移除 {len(removed)})")
+
+    def refresh_channel(self, provider, state):
+        try:
+            result = provider.fetch(state.channel)
+        except Exception as e:
+            logger.error(f"[{provider.name}] 刷新 {state.channel} 失敗: {e}")
+            result = None
+
+        if result is None:
+            state.failures += 1
+        elif state.update(*result):
+            provider.dirty = True
+            logger.info(f"[{provider.name}] {state.channel.get('channelName')} 節目表已變動")
+
+        return plan_next_refresh(
+            time.time(), state.horizon_end, state.change_rate, state.failures,
+            self.min_interval, self.max_interval
+        )
+
+    def flush(self, now, force=False):
+        """重寫有變動的輸出檔案，兩次寫入至少間隔 write_interval 秒"""
+        for provider in self.providers.values():
+            if not provider.dirty:
+                continue
+            if not force and now - self.last_write.get(provider.name, 0) < self.write_interval:
+                continue
+            try:
+                provider.output()
+            except Exception as e:
+                logger.error(f"[{provider.name}] 重寫輸出失敗: {e}")
+            self.last_write[provider.name] = now
+
+    def run_once(self):
+        """處理一個到期事件，返回距下個事件的等待秒數"""
+        now = time.time()
+        for provider in self.providers.values():
+            if now >= provider.next_lineup:
+                self.refresh_lineup(provider, now)
+
+        if not self.queue:
+            return self.min_interval
+
+        when, _, name, key = self.queue[0]
+        if when > now:
+            return when - now
+
+        heapq.heappop(self.queue)
+        provider = self.providers[name]
+        state = provider.states.get(key)
+        # 已從頻道清單移除，或已被重新排程的過期項目
+        if state is None or state.next_refresh != when:
+            return 0
+
+        self.schedule(provider, key, self.refresh_channel(provider, state))
+        return self.spacing + random.uniform(0, self.spacing)
+
+    def run(self):
+        logger.info(f"常駐模式啟動: {', '.join(self.providers)}")
+        try:
+            while True:
+                wait = self.run_once()
+                self.flush(time.time())
+                if wait > 0:
+                    time.sleep(min(wait, self.write_interval))
+        except KeyboardInterrupt:
+            logger.info("收到中斷信號，寫入未保存的變動後退出")
+        finally:
+            self.flush(time.time(), force=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='電子節目表常駐模式')
+    parser.add_argument('--providers', type=str, default='hami,4gtv,ofiii',
+                        help='啟用的來源，以逗號分隔 (默認: hami,4gtv,ofiii)')
+    parser.add_argument('--spacing', type=float, default=2.0,
+                        help='兩次請求之間的最短間隔秒數 (默認: 2)')
+    parser.add_argument('--warmup', type=float, default=600,
+                        help='啟動時首次抓取分散到的秒數 (默認: 600)')
+    parser.add_argument('--write-interval', type=float, default=300,
+                        help='同一輸出檔案兩次重寫之間的最短秒數 (默認: 300)')
+    parser.add_argument('--min-interval', type=float, default=MIN_INTERVAL,
+                        help=f'同一頻道最短刷新間隔秒數 (默認: {MIN_INTERVAL})')
+    parser.add_argument('--max-interval', type=float, default=MAX_INTERVAL,
+                        help=f'同一頻道最長刷新間隔秒數 (默認: {MAX_INTERVAL})')
+    epg_logging.add_arguments(parser)
+    args = parser.parse_args()
+    epg_logging.setup_logging(args.log_level, os.path.join(OUTPUT_DIR, 'epg_daemon.log'))
+
+    names = [name.strip() for name in args.providers.split(',') if name.strip()]
+    unknown = [name for name in names if name not in PROVIDERS]
+    if unknown:
+        parser.error(f"未知的來源: {', '.join(unknown)}")
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    providers = {name: PROVIDERS[name]() for name in names}
+    Daemon(
+        providers,
+        spacing=args.spacing,
+        warmup=args.warmup,
+        write_interval=args.write_interval,
+        min_interval=args.min_interval,
+        max_interval=args.max_interval
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""精簡匯出格式：JSON Lines 與列式二進位檔
+
+兩種格式都按頻道分組、頻道內按開始時間排序（輸入為已整理的節目），並附每頻道的位移索引，
+使用端可以 mmap 檔案後直接定位到單一頻道，不需解碼其餘內容。
+
+JSON Lines (<名稱>.jsonl)
+    每行一個節目: {"channel", "start", "stop", "title", "desc"}，時間為 Unix 時間戳。
+    索引 <名稱>.jsonl.idx 為 JSON: {頻道: [位元組位移, 位元組長度, 節目數]}。
+
+列式二進位 (<名稱>.epgb，小端序)
+    檔頭    magic b'EPGB', u16 版本, u16 保留, u32 頻道數, u32 字串數, u32 節目數,
+            u64 頻道索引位移, u64 字串表位移, u64 節目欄位位移
+    頻道索引 每頻道 u32 名稱字串ID, u32 第一個節目序號, u32 節目數
+    字串表  u32 位移陣列 (字串數+1) 後接 UTF-8 內容；重複的節目名稱與描述只存一次
+    節目欄位 start[], stop[], title_id[], desc_id[] 四個 u32 陣列，各長為節目數
+"""
+import os
+import mmap
+import struct
+import argparse
+
+import epg_json
+
+MAGIC = b'EPGB'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIIQQQ')
+CHANNEL_ENTRY = struct.Struct('<III')
+FORMATS = ('jsonl', 'bin')
+
+
+def group_rows(channel_ids, rows):
+    """將 (channel, start, stop, title, desc, ...) 行按頻道清單順序分組
+
+    rows 須來自 epg_normalize.normalize_programs 整理後的節目，各頻道內已按開始時間排序，
+    此處不再排序。不在頻道清單中的節目會被忽略；重複的頻道ID只保留第一次出現的位置。
+    """
+    groups = {}
+    for channel_id in channel_ids:
+        groups.setdefault(channel_id, [])
+    for row in rows:
+        group = groups.get(row[0])
+        if group is not None:
+            group.append((row[1], row[2], row[3] or "", row[4] or ""))
+    return list(groups.items())
+
+
+def write_jsonl(groups, path):
+    """寫入 JSON Lines 與位移索引，返回節目數"""
+    index = {}
+    count = 0
+    with open(path, 'wb') as f:
+        for channel_id, programs in groups:
+            offset = f.tell()
+            for start, stop, title, desc in programs:
+                line = epg_json.dumps({
+                    "channel": channel_id, "start": start, "stop": stop, "title": title, "desc": desc
+                })
+                f.write(line.encode('utf-8') + b'\n')
+            index[channel_id] = [offset, f.tell() - offset, len(programs)]
+            count += len(programs)
+    epg_json.dump_file(index, path + '.idx')
+    return count
+
+
+def write_binary(groups, path):
+    """寫入列式二進位檔，返回節目數"""
+    strings = []
+    string_ids = {}
+
+    def intern(value):
+        string_id = string_ids.get(value)
+        if string_id is None:
+            string_id = string_ids[value] = len(strings)
+            strings.append(value)
+        return string_id
+
+    channel_entries = []
+    starts, stops, titles, descs = [], [], [], []
+    for channel_id, programs in groups:
+        channel_entries.append((intern(channel_id), len(starts), len(programs)))
+        for start, stop, title, desc in programs:
+            starts.append(start)
+            stops.append(stop)
+            titles.append(intern(title))
+            descs.append(intern(desc))
+
+    encoded = [s.encode('utf-8') for s in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    n_programs = len(starts)
+    channel_index_offset = HEADER.size
+    string_table_offset = channel_index_offset + CHANNEL_ENTRY.size * len(channel_entries)
+    programs_offset = string_table_offset + 4 * len(string_offsets) + string_offsets[-1]
+    # 節目欄位按 4 位元組對齊
+    padding = -programs_offset % 4
+    programs_offset += padding
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(
+            MAGIC, VERSION, 0, len(channel_entries), len(strings), n_programs,
+            channel_index_offset, string_table_offset, programs_offset
+        ))
+        for entry in channel_entries:
+            f.write(CHANNEL_ENTRY.pack(*entry))
+        f.write(struct.pack(f'<{len(string_offsets)}I', *string_offsets))
+        f.write(b''.join(encoded))
+        f.write(b'\0' * padding)
+        for column in (starts, stops, titles, descs):
+            f.write(struct.pack(f'<{n_programs}I', *column))
+    return n_programs
+
+
+def export(base_path, formats, channel_ids, rows):
+    """依 formats 寫出 <base_path>.jsonl 與/或 <base_path>.epgb，返回寫出的檔案路徑"""
+    groups = group_rows(channel_ids, rows)
+    paths = []
+    if 'jsonl' in formats:
+        write_jsonl(groups, base_path + '.jsonl')
+        paths.append(base_path + '.jsonl')
+    if 'bin' in formats:
+        write_binary(groups, base_path + '.epgb')
+        paths.append(base_path + '.epgb')
+    return paths
+
+
+def parse_formats(value):
+    """解析命令行的 --export 參數，如 'jsonl,bin'"""
+    formats = [item.strip() for item in value.split(',') if item.strip()]
+    unknown = [item for item in formats if item not in FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"未知的匯出格式: {', '.join(unknown)}")
+    return formats
+
+
+def add_arguments(parser):
+    """為腳本的命令行加入匯出參數"""
+    parser.add_argument('--export', type=parse_formats, default=[],
+                        help='同時輸出精簡格式 (與XML同名的 .jsonl/.epgb)，以逗號分隔: jsonl,bin')
+
+
+class JsonlReader:
+    """以索引定位並讀取 JSON Lines 中單一頻道的節目"""
+
+    def __init__(self, path):
+        self.index = epg_json.load_file(path + '.idx')
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+    def channels(self):
+        return list(self.index)
+
+    def programmes(self, channel_id):
+        entry = self.index.get(channel_id)
+        if not entry:
+            return []
+        offset, length, _ = entry
+        return [epg_json.loads(line) for line in self._mmap[offset:offset + length].splitlines()]
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class BinaryReader:
+    """以 mmap 讀取列式二進位檔，只解碼所查詢頻道的欄位與字串"""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, n_channels, n_strings, n_programs,
+         channel_index_offset, string_table_offset, programs_offset) = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不支援的檔案格式: {path}")
+
+        self.n_programs = n_programs
+        self._programs_offset = programs_offset
+        self._string_table_offset = string_table_offset
+        self._string_data_offset = string_table_offset + 4 * (n_strings + 1)
+
+        self.index = {}
+        for i in range(n_channels):
+            name_id, first, count = CHANNEL_ENTRY.unpack_from(
+                self._mmap, channel_index_offset + i * CHANNEL_ENTRY.size
+            )
+            self.index[self.string(name_id)] = (first, count)
+
+    def string(self, string_id):
+        start, end = struct.unpack_from('<II', self._mmap, self._string_table_offset + 4 * string_id)
+        return self._mmap[self._string_data_offset + start:self._string_data_offset + end].decode('utf-8')
+
+    def channels(self):
+        return list(self.index)
+
+    def _column(self, column, first, count):
+        offset = self._programs_offset + 4 * (column * self.n_programs + first)
+        return struct.unpack_from(f'<{count}I', self._mmap, offset)
+
+    def programmes(self, channel_id):
+        """返回 [(start, stop, title, desc)]"""
+        first, count = self.index.get(channel_id, (0, 0))
+        if not count:
+            return []
+        starts, stops, titles, descs = (self._column(c, first, count) for c in range(4))
+        cache = {}
+
+        def lookup(string_id):
+            if string_id not in cache:
+                cache[string_id] = self.string(string_id)
+            return cache[string_id]
+
+        return [
+            (start, stop, lookup(title), lookup(desc))
+            for start, stop, title, desc in zip(starts, stops, titles, descs)
+        ]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
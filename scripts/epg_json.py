@@ -0,0 +1,61 @@
+import os
+import json
+
+# 有安裝 orjson 時使用 orjson 編解碼，否則回退到標準庫 json
+# 可用環境變數 EPG_JSON_BACKEND=json 強制使用標準庫
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if os.environ.get('EPG_JSON_BACKEND') == 'json':
+    orjson = None
+
+BACKEND = 'orjson' if orjson else 'json'
+
+# orjson.JSONDecodeError 為 json.JSONDecodeError 的子類別，兩種後端可共用
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data):
+    """解碼 JSON，接受 str 或 bytes"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj, indent=False):
+    """編碼為 JSON 字串（保留非ASCII字元），indent 為 True 時以兩格縮排"""
+    if orjson:
+        option = orjson.OPT_INDENT_2 if indent else 0
+        return orjson.dumps(obj, option=option).decode('utf-8')
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def dump_file(obj, path, indent=False):
+    """以 UTF-8 寫入 JSON 檔案
+
+    先寫入以進程ID區分的暫存檔再以 os.replace 替換，多個進程同時寫入同一檔案
+    或讀取端在寫入途中讀取時，都只會看到完整的檔案。
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if orjson:
+            option = orjson.OPT_INDENT_2 if indent else 0
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(obj, option=option))
+        else:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(dumps(obj, indent=indent))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_file(path):
+    """讀取 JSON 檔案"""
+    with open(path, 'rb') as f:
+        return loads(f.read())
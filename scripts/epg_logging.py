@@ -0,0 +1,91 @@
+"""統一日誌設定與進度摘要
+
+三個腳本共用的日誌層級規範:
+  DEBUG    單一請求或單一頻道的細節（延遲、逐頻道成功、逐日請求）
+  INFO     階段開始/結束與定期進度摘要
+  SUCCESS  整體結果（輸出檔案已生成）
+  WARNING  單一頻道失敗或資料異常，已跳過
+  ERROR    請求失敗
+  CRITICAL 整次執行失敗
+
+控制台與檔案 sink 皆以 enqueue=True 建立，日誌先放入佇列再由背景執行緒寫出，
+抓取與解析迴圈不會因 I/O 而阻塞；逐頻道事件由 ProgressReporter 彙總為定期摘要。
+"""
+import sys
+import time
+from loguru import logger
+
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+LEVELS = ('DEBUG', 'INFO', 'SUCCESS', 'WARNING', 'ERROR', 'CRITICAL')
+
+# 進度摘要的最短間隔秒數
+PROGRESS_INTERVAL = 15
+
+
+def add_arguments(parser):
+    """為腳本的命令行加入日誌參數"""
+    parser.add_argument('--log-level', type=str.upper, default='INFO', choices=LEVELS,
+                        help='日誌層級 (默認: INFO)')
+
+
+def setup_logging(level='INFO', log_file=None):
+    """設定控制台與可選的檔案 sink，兩者皆經由背景佇列寫出"""
+    logger.remove()
+    logger.add(sys.stderr, level=level, format=LOG_FORMAT, enqueue=True)
+    if log_file:
+        logger.add(
+            log_file,
+            level=level,
+            rotation="1 day",
+            retention="7 days",
+            encoding="utf-8",
+            format=LOG_FORMAT,
+            enqueue=True
+        )
+
+
+class ProgressReporter:
+    """彙總逐頻道事件，定期輸出一行進度摘要"""
+
+    def __init__(self, name, total, interval=PROGRESS_INTERVAL):
+        self.name = name
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.succeeded = 0
+        self.programs = 0
+        self.failed = []
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def success(self, channel, count):
+        self.done += 1
+        self.succeeded += 1
+        self.programs += count
+        logger.debug(f"[{self.name}] {channel}: {count} 個節目")
+        self._maybe_report()
+
+    def failure(self, channel, reason=None):
+        self.done += 1
+        self.failed.append(channel)
+        logger.warning(f"[{self.name}] {channel} 失敗" + (f": {reason}" if reason else ""))
+        self._maybe_report()
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def report(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        logger.info(
+            f"[{self.name}] 進度 {self.done}/{self.total} 個頻道, 成功 {self.succeeded}, "
+            f"失敗 {len(self.failed)}, 共 {self.programs} 個節目, {self.done / elapsed:.2f} 頻道/秒"
+        )
+
+    def finish(self):
+        """輸出最終摘要"""
+        self.report()
+        if self.failed:
+            logger.warning(f"[{self.name}] 失敗頻道 ({len(self.failed)}): {', '.join(self.failed)}")
@@ -0,0 +1,130 @@
+"""單一頻道節目表的線性時間整理
+
+各來源的節目本身已大致按時間排列（Hami 為逐日的有序列表，4gtv/ofiii 為單一列表），
+因此不再對整個頻道重新排序，而是以 split_runs 切出已排序的連續段落（Hami 逐日列表
+串接後每天即為一段）後以 heapq.merge 做 k 路合併，再於同一次遍歷中:
+  - 刪除零長度或結束早於開始的節目（如 ofiii 的 Duration 為 0）
+  - 刪除與前一個節目開始時間相同的重複節目（如跨日重複出現的節目）
+  - 前一個節目的結束時間超過下一個節目開始時，將其截至下一個節目開始
+  - 可選地以佔位節目填補節目之間的空檔
+k 個段落的合併為 O(n log k)，輸入已排序時 k 為 1，即 O(n)。
+
+各腳本在生成XML、精簡匯出與寫入資料庫之前以 normalize_programs 整理一次，
+三種輸出得到相同的節目；生成函數與 epg_export.group_rows 不再自行排序。
+"""
+import heapq
+from collections import Counter
+from operator import itemgetter
+from loguru import logger
+
+# 空檔佔位節目的名稱
+FILLER_TITLE = "暫無節目資訊"
+
+_start = itemgetter("start")
+
+# 由命令行設定的預設值，見 setup()
+_fill_gaps = False
+
+
+def add_arguments(parser):
+    """為腳本的命令行加入整理參數"""
+    parser.add_argument('--fill-gaps', action='store_true',
+                        help=f'以「{FILLER_TITLE}」填補節目之間的空檔')
+
+
+def setup(args):
+    """依命令行參數設定預設行為"""
+    global _fill_gaps
+    _fill_gaps = bool(getattr(args, 'fill_gaps', False))
+
+
+def split_runs(programs):
+    """將節目列表切成按開始時間遞增的連續段落，每段必定已排序"""
+    runs = []
+    run = []
+    for program in programs:
+        if run and program["start"] < run[-1]["start"]:
+            runs.append(run)
+            run = []
+        run.append(program)
+    if run:
+        runs.append(run)
+    return runs
+
+
+def merge_runs(runs):
+    """k 路合併 split_runs 切出的已排序段落"""
+    if len(runs) == 1:
+        return iter(runs[0])
+    return heapq.merge(*runs, key=_start)
+
+
+def normalize(programs, fill_gaps=None, stats=None):
+    """整理單一頻道的節目，返回按開始時間排序的新列表
+
+    被截短的節目以副本修改，不影響原始字典。stats 為 Counter 時累計各項處理數量。
+    """
+    if fill_gaps is None:
+        fill_gaps = _fill_gaps
+    if stats is None:
+        stats = Counter()
+
+    result = []
+    for program in merge_runs(split_runs(programs)):
+        if program["end"] <= program["start"]:
+            stats["zero_length"] += 1
+            continue
+
+        if result:
+            previous = result[-1]
+            if program["start"] == previous["start"]:
+                stats["duplicate"] += 1
+                continue
+            if program["start"] < previous["end"]:
+                result[-1] = dict(previous, end=program["start"])
+                stats["trimmed"] += 1
+            elif fill_gaps and program["start"] > previous["end"]:
+                result.append(dict(
+                    previous,
+                    programName=FILLER_TITLE,
+                    description="",
+                    subtitle="",
+                    start=previous["end"],
+                    end=program["start"]
+                ))
+                stats["filled"] += 1
+
+        result.append(program)
+    return result
+
+
+def group_by(programs, field):
+    """按欄位將節目分組，保留各組內原本的順序"""
+    groups = {}
+    for program in programs:
+        groups.setdefault(program[field], []).append(program)
+    return groups
+
+
+def normalize_programs(programs, field, fill_gaps=None):
+    """按 field 分組後逐頻道整理，返回依頻道分組、組內按開始時間排序的節目列表"""
+    stats = Counter()
+    result = []
+    for channel_programs in group_by(programs, field).values():
+        result.extend(normalize(channel_programs, fill_gaps, stats))
+    summary = describe(stats)
+    if summary:
+        logger.info(f"節目整理: {summary}")
+    return result
+
+
+def describe(stats):
+    """將統計結果格式化為一行摘要，沒有任何修改時返回空字串"""
+    labels = (
+        ("duplicate", "重複"),
+        ("zero_length", "零長度"),
+        ("trimmed", "截短重疊"),
+        ("filled", "填補空檔"),
+    )
+    parts = [f"{label} {stats[key]}" for key, label in labels if stats[key]]
+    return ", ".join(parts)
@@ -0,0 +1,89 @@
+import os
+import pytz
+from datetime import datetime
+from concurrent.futures import Future, ProcessPoolExecutor
+
+TAIPEI_TZ = pytz.timezone('Asia/Taipei')
+
+# 精簡節目記錄: (開始時間戳, 結束時間戳, 節目名稱, 節目描述, 副標題)
+# 子進程只回傳整數與字串組成的元組，避免跨進程序列化 datetime/時區物件
+START, END, TITLE, DESC, SUBTITLE = range(5)
+
+
+def to_timestamp(dt):
+    """帶時區的 datetime 轉為整數時間戳"""
+    return int(dt.timestamp())
+
+
+def from_compact(records, **fields):
+    """將精簡記錄還原為節目字典，fields 為每筆節目共用的欄位（如頻道名稱）"""
+    programs = []
+    for start_ts, end_ts, title, desc, subtitle in records:
+        program = dict(fields)
+        program.update({
+            "programName": title,
+            "description": desc,
+            "subtitle": subtitle,
+            "start": datetime.fromtimestamp(start_ts, TAIPEI_TZ),
+            "end": datetime.fromtimestamp(end_ts, TAIPEI_TZ)
+        })
+        programs.append(program)
+    return programs
+
+
+def resolve_workers(workers):
+    """解析進程數設定: 0 表示在主進程內解析，負數表示使用全部CPU核心"""
+    if workers is None:
+        return 0
+    if workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+class _Deferred:
+    """主進程內解析時的延遲結果，介面與 Future.result() 相同"""
+
+    def __init__(self, fn, args):
+        self._fn = fn
+        self._args = args
+        self._future = None
+
+    def result(self):
+        if self._future is None:
+            self._future = Future()
+            try:
+                self._future.set_result(self._fn(*self._args))
+            except Exception as e:
+                self._future.set_exception(e)
+        return self._future.result()
+
+
+class ParsePool:
+    """解析進程池
+
+    抓取迴圈將原始回應內容提交至進程池後即可繼續下一個請求，
+    BeautifulSoup/JSON 解碼與時間轉換在子進程中完成，不佔用抓取執行緒的GIL。
+    workers 為 0 時在主進程內解析，延後到取結果時才執行，使抓取與解析階段可分開計時。
+    """
+
+    def __init__(self, workers=0):
+        self.workers = resolve_workers(workers)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers else None
+
+    def submit(self, fn, *args):
+        """提交解析工作，回傳 Future；fn 必須是模組層級函數以便跨進程傳遞"""
+        if self._executor:
+            return self._executor.submit(fn, *args)
+        return _Deferred(fn, args)
+
+    def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
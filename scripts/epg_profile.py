@@ -0,0 +1,153 @@
+"""分階段效能剖析
+
+各腳本以 `with phase('fetch'):` 標記 discovery/fetch/parse/generate 等階段。
+未啟用時 phase() 不做任何事；以 --profile 啟用後記錄各階段耗時，並可選擇:
+  - cprofile: 每個階段輸出 cProfile 統計檔 (output/profile/*.prof)
+  - sample:   每個階段輸出 pyinstrument 取樣報告 (需安裝 pyinstrument)
+  - --profile-memory: 以 tracemalloc 記錄每個階段的記憶體峰值
+每次執行的摘要以一行 JSON 附加到 output/profile/<腳本>.jsonl，便於追蹤各階段的長期變化；
+output/profile/ 不納入版本控制，CI 以 workflow artifact 上傳。
+"""
+import os
+import time
+import cProfile
+import tracemalloc
+from datetime import datetime
+from contextlib import contextmanager
+from loguru import logger
+
+import epg_json
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+
+MODES = ('timer', 'cprofile', 'sample')
+
+
+def add_arguments(parser):
+    """為腳本的命令行加入剖析參數"""
+    parser.add_argument('--profile', nargs='?', const='timer', choices=MODES,
+                        help='記錄各階段耗時；cprofile/sample 另輸出各階段剖析檔 (默認: timer)')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='以 tracemalloc 記錄各階段記憶體峰值 (需同時指定 --profile)')
+
+
+class PhaseProfiler:
+    """記錄一次執行中各階段的耗時與剖析資料"""
+
+    def __init__(self, script, mode='timer', memory=False, output_dir=OUTPUT_DIR):
+        self.script = script
+        self.mode = mode
+        self.memory = memory
+        self.output_dir = output_dir
+        self.started = datetime.now()
+        self.phases = []
+
+        if mode == 'sample':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                logger.warning("未安裝 pyinstrument，改為只記錄階段耗時")
+                self.mode = 'timer'
+
+    def _artifact_path(self, name, ext):
+        directory = os.path.join(self.output_dir, 'profile')
+        os.makedirs(directory, exist_ok=True)
+        stamp = self.started.strftime('%Y%m%d-%H%M%S')
+        return os.path.join(directory, f"{self.script}-{stamp}-{name}.{ext}")
+
+    @contextmanager
+    def phase(self, name):
+        record = {"name": name}
+        profiler = None
+
+        if self.mode == 'cprofile':
+            profiler = cProfile.Profile()
+        elif self.mode == 'sample':
+            from pyinstrument import Profiler
+            profiler = Profiler()
+
+        if self.memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+            memory_base = tracemalloc.get_traced_memory()[0]
+
+        if self.mode == 'cprofile':
+            profiler.enable()
+        elif self.mode == 'sample':
+            profiler.start()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            record["seconds"] = round(time.perf_counter() - t0, 4)
+            if profiler:
+                if self.mode == 'cprofile':
+                    profiler.disable()
+                    path = self._artifact_path(name, 'prof')
+                    profiler.dump_stats(path)
+                else:
+                    profiler.stop()
+                    path = self._artifact_path(name, 'txt')
+                    with open(path, 'w', encoding='utf-8') as f:
+                        f.write(profiler.output_text(unicode=True))
+                record["artifact"] = os.path.relpath(path, self.output_dir)
+            if self.memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                record["peak_kb"] = round((peak - memory_base) / 1024, 1)
+            self.phases.append(record)
+
+    def save(self):
+        """將本次執行摘要附加到 output/profile/<腳本>.jsonl，返回檔案路徑"""
+        if self.memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        summary = {
+            "script": self.script,
+            "started": self.started.isoformat(timespec='seconds'),
+            "mode": self.mode,
+            "total_seconds": round(sum(p["seconds"] for p in self.phases), 4),
+            "phases": self.phases
+        }
+        directory = os.path.join(self.output_dir, 'profile')
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.script}.jsonl")
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(epg_json.dumps(summary) + '\n')
+        return path
+
+
+_active = None
+
+
+def enable(script, mode='timer', memory=False):
+    """啟用全域剖析器，返回 PhaseProfiler"""
+    global _active
+    _active = PhaseProfiler(script, mode or 'timer', memory)
+    return _active
+
+
+def setup(script, args):
+    """依命令行參數啟用剖析，未指定 --profile 時返回None"""
+    if not getattr(args, 'profile', None):
+        return None
+    return enable(script, args.profile, args.profile_memory)
+
+
+def save():
+    """保存全域剖析器的摘要，未啟用時返回None"""
+    if _active is None:
+        return None
+    return _active.save()
+
+
+@contextmanager
+def phase(name):
+    """標記一個階段；未啟用剖析時不做任何事"""
+    if _active is None:
+        yield
+        return
+    with _active.phase(name):
+        yield
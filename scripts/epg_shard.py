@@ -0,0 +1,301 @@
+"""頻道分片：多個進程或多個工作分別抓取部分頻道，再合併為最終輸出
+
+各腳本以 --shard i/n（i 從 0 起算）執行時，只處理以穩定雜湊分配到第 i 片的頻道，
+並將結果寫入部分檔案 (.cache/shards/<來源>-<i>of<n>.json)；頻道所屬分片只取決於
+頻道ID與分片數，頻道清單增減不會改變其他頻道的分配。合併步驟依原始頻道順序
+組合所有部分檔案，生成 4g.xml / ofiii.xml / hami.xml。
+
+用法:
+  python scripts/fourgtv_epg.py --shard 0/4          # 各工作分別執行 0/4 .. 3/4
+  python scripts/epg_shard.py merge 4gtv --shards 4  # 合併
+  python scripts/epg_shard.py run ofiii --shards 4   # 在本機以 4 個進程執行並合併
+
+部分檔案以暫存檔寫入後替換，並記錄來源、分片、執行ID (環境變數 EPG_SHARD_RUN_ID，
+如 CI 的 github.run_id) 與寫入時間；合併時逐一檢查，拒絕其他執行留下的或過期的部分檔案。
+"""
+import os
+import sys
+import time
+import uuid
+import hashlib
+import argparse
+import subprocess
+from datetime import datetime
+from loguru import logger
+
+import epg_json
+import epg_export
+import epg_logging
+import epg_normalize
+from epg_parse_pool import TAIPEI_TZ, to_timestamp
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS_DIR = os.path.join(BASE_DIR, 'scripts')
+OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
+SHARD_DIR = os.path.join(BASE_DIR, '.cache', 'shards')
+
+SCRIPTS = {
+    '4gtv': 'fourgtv_epg.py',
+    'ofiii': 'ofiii_epg.py',
+    'hami': 'Hami.py',
+}
+# 執行ID的環境變數；同一次執行的各分片與合併步驟須使用相同的值
+RUN_ID_ENV = 'EPG_SHARD_RUN_ID'
+# 合併時接受的部分檔案最長存在時數
+MAX_AGE_HOURS = 12
+
+OUTPUT_FILES = {
+    '4gtv': '4g.xml',
+    'ofiii': 'ofiii.xml',
+    'hami': 'hami.xml',
+}
+
+
+class PartialError(Exception):
+    """部分檔案無法讀取或不屬於本次合併"""
+
+
+def shard_of(key, count):
+    """以 SHA-1 計算穩定的分片編號，不受 PYTHONHASHSEED 與頻道清單變動影響"""
+    digest = hashlib.sha1(str(key).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+class Shard:
+    """一個分片 (index/count)，select() 時記錄完整頻道清單順序供合併使用"""
+
+    def __init__(self, index, count):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"無效的分片: {index}/{count}")
+        self.index = index
+        self.count = count
+        self.lineup = []
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    def select(self, channels, key):
+        """篩選屬於本分片的頻道"""
+        self.lineup = [key(channel) for channel in channels]
+        selected = [channel for channel in channels if shard_of(key(channel), self.count) == self.index]
+        logger.info(f"分片 {self}: 處理 {len(selected)}/{len(channels)} 個頻道")
+        return selected
+
+
+def parse_shard(value):
+    """解析命令行的 --shard 參數，如 '0/4'"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+        return Shard(index, count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"分片格式應為 i/n (0 <= i < n): {value}")
+
+
+def add_arguments(parser):
+    """為腳本的命令行加入分片參數"""
+    parser.add_argument('--shard', type=parse_shard,
+                        help='只處理第 i 片頻道並寫出部分結果，格式 i/n (i 從 0 起算)')
+
+
+def partial_path(provider, index, count, shard_dir=SHARD_DIR):
+    return os.path.join(shard_dir, f"{provider}-{index}of{count}.json")
+
+
+def log_path(provider, shard, shard_dir=SHARD_DIR):
+    """分片各自的日誌檔路徑"""
+    os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, f"{provider}-{shard.index}of{shard.count}.log")
+
+
+def _encode_program(program):
+    encoded = dict(program)
+    encoded["start"] = to_timestamp(program["start"])
+    encoded["end"] = to_timestamp(program["end"])
+    return encoded
+
+
+def _decode_program(program):
+    program["start"] = datetime.fromtimestamp(program["start"], TAIPEI_TZ)
+    program["end"] = datetime.fromtimestamp(program["end"], TAIPEI_TZ)
+    return program
+
+
+def write_partial(provider, shard, channels, programs, key, extra=None, shard_dir=SHARD_DIR):
+    """寫出本分片的部分結果，返回檔案路徑"""
+    os.makedirs(shard_dir, exist_ok=True)
+    path = partial_path(provider, shard.index, shard.count, shard_dir)
+    epg_json.dump_file({
+        "provider": provider,
+        "shard": [shard.index, shard.count],
+        "run_id": os.environ.get(RUN_ID_ENV),
+        "created": int(time.time()),
+        "lineup": shard.lineup,
+        "channels": [[key(channel), channel] for channel in channels],
+        "programs": [_encode_program(program) for program in programs],
+        "extra": extra or {}
+    }, path)
+    logger.info(f"分片 {shard} 部分結果已寫入: {path} ({len(channels)} 個頻道, {len(programs)} 個節目)")
+    return path
+
+
+def load_partials(provider, count, shard_dir=SHARD_DIR, run_id=None, max_age_hours=MAX_AGE_HOURS):
+    """讀取並檢查全部 count 個部分檔案
+
+    缺少任何一片時拋出 FileNotFoundError；檔案損壞、來源或分片不符、執行ID不符
+    （未指定 run_id 時要求各分片一致）或超過 max_age_hours 時拋出 PartialError。
+    """
+    partials = []
+    now = time.time()
+    for index in range(count):
+        path = partial_path(provider, index, count, shard_dir)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"缺少分片 {index}/{count} 的部分結果: {path}")
+        try:
+            partial = epg_json.load_file(path)
+        except (epg_json.JSONDecodeError, ValueError, OSError) as e:
+            raise PartialError(f"無法讀取分片 {index}/{count} 的部分結果 {path}: {e}")
+        if not isinstance(partial, dict) or partial.get("provider") != provider \
+                or partial.get("shard") != [index, count]:
+            raise PartialError(f"部分結果 {path} 不屬於 {provider} 的分片 {index}/{count}")
+        if run_id is not None and partial.get("run_id") != run_id:
+            raise PartialError(f"部分結果 {path} 來自其他執行 ({partial.get('run_id')})，預期 {run_id}")
+        age = now - partial.get("created", 0)
+        if max_age_hours and age > max_age_hours * 3600:
+            raise PartialError(f"部分結果 {path} 已寫入 {age / 3600:.1f} 小時，超過 {max_age_hours} 小時")
+        partials.append(partial)
+
+    run_ids = {partial.get("run_id") for partial in partials}
+    if len(run_ids) > 1:
+        raise PartialError(f"{provider} 的各分片來自不同執行: {', '.join(str(r) for r in sorted(run_ids, key=str))}")
+    return partials
+
+
+def merge_partials(partials):
+    """按原始頻道順序合併部分結果，返回 (channels, programs, extras)"""
+    # 各分片的頻道清單可能在不同時間取得，以第一個分片為準，其餘未知頻道排在最後
+    lineup = partials[0]["lineup"] if partials else []
+    positions = {key: i for i, key in enumerate(lineup)}
+
+    entries = []
+    programs = []
+    extras = []
+    for partial in partials:
+        entries.extend(partial["channels"])
+        programs.extend(_decode_program(program) for program in partial["programs"])
+        extras.append(partial.get("extra") or {})
+
+    entries.sort(key=lambda entry: positions.get(entry[0], len(positions)))
+    return [channel for _, channel in entries], programs, extras
+
+
+def provider_module(provider):
+    """延遲載入來源腳本，只有合併該來源時才需要其依賴"""
+    if provider == '4gtv':
+        import fourgtv_epg
+        return fourgtv_epg
+    if provider == 'ofiii':
+        import ofiii_epg
+        return ofiii_epg
+    if provider == 'hami':
+        import Hami
+        return Hami
+    raise ValueError(f"未知的來源: {provider}")
+
+
+def write_output(module, channels, programs, output_file):
+    """以各來源原本的生成函數寫出 XMLTV"""
+    if hasattr(module, 'generate_xml'):
+        module.generate_xml(channels, programs, output_file)
+    elif hasattr(module, 'generate_xmltv'):
+        if not module.generate_xmltv(channels, programs, output_file):
+            raise IOError(f"無法寫入 {output_file}")
+    else:
+        module.generate_xml_epg(channels, programs).write(output_file, encoding="utf-8", xml_declaration=True)
+
+
+def merge(provider, count, output_file=None, export_formats=None, store_path=None, shard_dir=SHARD_DIR,
+          run_id=None, max_age_hours=MAX_AGE_HOURS):
+    """合併部分結果並生成最終輸出"""
+    partials = load_partials(provider, count, shard_dir, run_id, max_age_hours)
+    channels, programs, extras = merge_partials(partials)
+    output_file = output_file or os.path.join(OUTPUT_DIR, OUTPUT_FILES[provider])
+
+    module = provider_module(provider)
+    programs = module.normalize_programs(programs)
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    write_output(module, channels, programs, output_file)
+    logger.success(f"已合併 {count} 個分片: {output_file} ({len(channels)} 個頻道, {len(programs)} 個節目)")
+
+    if export_formats:
+        module.export_compact(os.path.splitext(output_file)[0], export_formats, channels, programs)
+    if store_path:
+        module.save_to_store(store_path, channels, programs)
+
+    if provider == 'hami':
+        # 各分片只探測了自己的頻道，合併後統一更新日期範圍記錄
+        horizon = None
+        for extra in extras:
+            if "horizon_file" not in extra:
+                continue
+            if horizon is None:
+                horizon = module.Horizon(extra["horizon_file"])
+            horizon.windows.update(extra["horizon"])
+        if horizon is not None:
+            horizon.save()
+    return output_file
+
+
+def run_local(provider, count, extra_args, run_id):
+    """在本機以 count 個進程平行執行各分片，全部成功後返回 True"""
+    script = os.path.join(SCRIPTS_DIR, SCRIPTS[provider])
+    env = dict(os.environ, **{RUN_ID_ENV: run_id})
+    processes = [
+        subprocess.Popen([sys.executable, script, '--shard', f"{index}/{count}"] + extra_args, cwd=BASE_DIR, env=env)
+        for index in range(count)
+    ]
+    codes = [process.wait() for process in processes]
+    failed = [index for index, code in enumerate(codes) if code != 0]
+    if failed:
+        logger.error(f"分片執行失敗: {', '.join(f'{index}/{count}' for index in failed)}")
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='頻道分片合併與本機平行執行')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    for name, help_text in (('merge', '合併部分結果'), ('run', '在本機平行執行所有分片後合併')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('provider', choices=sorted(SCRIPTS))
+        sub.add_argument('--shards', type=int, required=True, help='分片數')
+        sub.add_argument('--output', type=str, help='輸出XML檔案路徑 (默認: output/ 下的原檔名)')
+        sub.add_argument('--store', type=str, help='同時寫入 SQLite 節目資料庫的路徑')
+        sub.add_argument('--run-id', type=str, default=os.environ.get(RUN_ID_ENV),
+                         help=f'只接受此執行ID的部分結果 (默認: 環境變數 {RUN_ID_ENV})')
+        sub.add_argument('--max-age', type=float, default=MAX_AGE_HOURS,
+                         help=f'部分結果的最長存在時數，0 表示不檢查 (默認: {MAX_AGE_HOURS})')
+        epg_export.add_arguments(sub)
+        epg_normalize.add_arguments(sub)
+
+    args, extra_args = parser.parse_known_args()
+    if args.command == 'merge' and extra_args:
+        parser.error(f"無法識別的參數: {' '.join(extra_args)}")
+    epg_logging.setup_logging()
+    epg_normalize.setup(args)
+
+    if args.command == 'run':
+        args.run_id = args.run_id or uuid.uuid4().hex
+        if not run_local(args.provider, args.shards, extra_args, args.run_id):
+            sys.exit(1)
+
+    try:
+        merge(args.provider, args.shards, args.output, args.export, args.store,
+              run_id=args.run_id, max_age_hours=args.max_age)
+    except (FileNotFoundError, PartialError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
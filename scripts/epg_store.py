@@ -0,0 +1,270 @@
+"""SQLite 節目資料庫：保存歷史節目並按頻道與時間範圍匯出 XMLTV
+
+節目以 (source, channel, start) 為主鍵（WITHOUT ROWID，資料即按該索引排列），
+各來源以批次交易寫入，每個頻道從本次第一個節目的開始時間起整段取代，過去的節目保留為歷史；
+匯出時逐頻道以索引範圍查詢並串流寫出，不需載入整個資料庫。匯出多個來源時頻道ID加上來源前綴
+（如 4gtv:台視），避免不同來源的同名頻道合併為同一個ID。
+
+用法:
+  python scripts/epg_store.py export --db output/epg.db --output next24h.xml --hours 24
+  python scripts/epg_store.py export --db output/epg.db --source 4gtv --channel 民視 --output minshi.xml
+"""
+import os
+import sqlite3
+import argparse
+from datetime import datetime
+from xml.sax.saxutils import XMLGenerator
+from loguru import logger
+
+from epg_parse_pool import TAIPEI_TZ, to_timestamp
+
+BATCH_SIZE = 1000
+# 查詢時間範圍時往前回溯的秒數，用於找出開始於範圍之前但仍在播出的節目
+LOOKBACK = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channels (
+    source TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    display_name TEXT NOT NULL,
+    icon TEXT,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (source, channel)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS programmes (
+    source TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    stop INTEGER NOT NULL,
+    title TEXT,
+    desc TEXT,
+    subtitle TEXT,
+    PRIMARY KEY (source, channel, start)
+) WITHOUT ROWID;
+"""
+
+
+def program_rows(programs, channel_of=None):
+    """將節目字典轉為資料庫行 (channel, start, stop, title, desc, subtitle)"""
+    for program in programs:
+        channel = channel_of(program) if channel_of else program["channelName"]
+        yield (
+            channel,
+            to_timestamp(program["start"]),
+            to_timestamp(program["end"]),
+            program.get("programName"),
+            program.get("description") or "",
+            program.get("subtitle") or ""
+        )
+
+
+class ProgrammeStore:
+    """節目資料庫"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def upsert_channels(self, source, channels):
+        """寫入頻道清單，channels 為 (channel, display_name, icon) 序列，順序即輸出順序
+
+        該來源不在新清單中的頻道於同一交易中刪除，不再匯出；其歷史節目保留在資料庫中。
+        """
+        rows = []
+        seen = set()
+        for channel, display_name, icon in channels:
+            # 同名頻道只保留第一次出現的位置
+            if channel in seen:
+                continue
+            seen.add(channel)
+            rows.append((source, channel, display_name, icon, len(rows)))
+        with self.conn:
+            removed = [
+                (source, channel)
+                for (channel,) in self.conn.execute("SELECT channel FROM channels WHERE source = ?", (source,))
+                if channel not in seen
+            ]
+            self.conn.executemany("DELETE FROM channels WHERE source = ? AND channel = ?", removed)
+            self.conn.executemany(
+                "INSERT INTO channels (source, channel, display_name, icon, position) "
+                "VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (source, channel) DO UPDATE SET "
+                "display_name = excluded.display_name, icon = excluded.icon, position = excluded.position",
+                rows
+            )
+
+    def upsert_programmes(self, source, rows, batch_size=BATCH_SIZE):
+        """批次寫入節目，rows 為 program_rows 產生的行；返回寫入行數
+
+        每個頻道從本次第一個節目的開始時間起的舊節目會先刪除（節目改期後不留下重疊的舊時段），
+        跨越該時間的舊節目截至該時間；刪除與該頻道第一批節目在同一個交易中完成。
+        """
+        rows = [(source,) + tuple(row) for row in rows]
+        first_start = {}
+        for row in rows:
+            channel, start = row[1], row[2]
+            if channel not in first_start or start < first_start[channel]:
+                first_start[channel] = start
+
+        sql = (
+            "INSERT INTO programmes (source, channel, start, stop, title, desc, subtitle) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (source, channel, start) DO UPDATE SET "
+            "stop = excluded.stop, title = excluded.title, desc = excluded.desc, subtitle = excluded.subtitle"
+        )
+        cleared = set()
+        for i in range(0, len(rows), batch_size):
+            batch = rows[i:i + batch_size]
+            with self.conn:
+                for channel in dict.fromkeys(row[1] for row in batch):
+                    if channel in cleared:
+                        continue
+                    cleared.add(channel)
+                    self._clear_from(source, channel, first_start[channel])
+                self.conn.executemany(sql, batch)
+        return len(rows)
+
+    def _clear_from(self, source, channel, start):
+        """刪除頻道在 start 之後開始的節目，並將跨越 start 的節目截至 start"""
+        self.conn.execute(
+            "DELETE FROM programmes WHERE source = ? AND channel = ? AND start >= ?",
+            (source, channel, start)
+        )
+        self.conn.execute(
+            "UPDATE programmes SET stop = ? WHERE source = ? AND channel = ? AND start >= ? AND start < ? AND stop > ?",
+            (start, source, channel, start - LOOKBACK, start, start)
+        )
+
+    def channels(self, source=None, channels=None):
+        """按 (來源, 位置) 順序返回 (source, channel, display_name, icon)"""
+        sql = "SELECT source, channel, display_name, icon FROM channels"
+        params = []
+        if source:
+            sql += " WHERE source = ?"
+            params.append(source)
+        sql += " ORDER BY source, position"
+        result = self.conn.execute(sql, params).fetchall()
+        if channels:
+            wanted = set(channels)
+            result = [row for row in result if row[1] in wanted or row[2] in wanted]
+        return result
+
+    def programmes(self, source, channel, start=None, end=None):
+        """以索引範圍查詢單一頻道在 [start, end) 內播出的節目，返回游標"""
+        sql = "SELECT start, stop, title, desc, subtitle FROM programmes WHERE source = ? AND channel = ?"
+        params = [source, channel]
+        if start is not None:
+            sql += " AND start >= ? AND stop > ?"
+            params += [start - LOOKBACK, start]
+        if end is not None:
+            sql += " AND start < ?"
+            params.append(end)
+        sql += " ORDER BY start"
+        return self.conn.execute(sql, params)
+
+    def export_xmltv(self, output_file, source=None, channels=None, start=None, end=None):
+        """串流匯出 XMLTV，返回 (頻道數, 節目數)"""
+        channel_rows = self.channels(source, channels)
+        channel_count = program_count = 0
+        # 多個來源可能有同名頻道（如 4gtv 與 ofiii 的台視），以來源前綴區分頻道ID
+        prefixed = len({row[0] for row in channel_rows}) > 1
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            xml = XMLGenerator(f, encoding='utf-8', short_empty_elements=True)
+            xml.startDocument()
+            xml.startElement("tv", {"generator-info-name": "EPG-Store"})
+
+            for row_source, channel, display_name, icon in channel_rows:
+                channel_id = f"{row_source}:{channel}" if prefixed else channel
+                xml.startElement("channel", {"id": channel_id})
+                _text_element(xml, "display-name", display_name)
+                if icon:
+                    xml.startElement("icon", {"src": icon})
+                    xml.endElement("icon")
+                xml.endElement("channel")
+                channel_count += 1
+
+                for prog_start, prog_stop, title, desc, subtitle in self.programmes(row_source, channel, start, end):
+                    xml.startElement("programme", {
+                        "start": _xmltv_time(prog_start),
+                        "stop": _xmltv_time(prog_stop),
+                        "channel": channel_id
+                    })
+                    _text_element(xml, "title", title or "")
+                    if subtitle:
+                        _text_element(xml, "sub-title", subtitle)
+                    if desc:
+                        _text_element(xml, "desc", desc)
+                    xml.endElement("programme")
+                    program_count += 1
+
+            xml.endElement("tv")
+            xml.endDocument()
+
+        return channel_count, program_count
+
+
+def _xmltv_time(timestamp):
+    return datetime.fromtimestamp(timestamp, TAIPEI_TZ).strftime("%Y%m%d%H%M%S %z")
+
+
+def _text_element(xml, name, text):
+    xml.startElement(name, {"lang": "zh"})
+    xml.characters(text)
+    xml.endElement(name)
+
+
+def _parse_time(value):
+    """解析 ISO 格式時間，未帶時區時視為台北時間"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = TAIPEI_TZ.localize(dt)
+    return to_timestamp(dt)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='節目資料庫')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help='按頻道與時間範圍匯出 XMLTV')
+    export.add_argument('--db', type=str, default='output/epg.db', help='資料庫路徑 (默認: output/epg.db)')
+    export.add_argument('--output', type=str, required=True, help='輸出XML檔案路徑')
+    export.add_argument('--source', type=str, help='只匯出指定來源 (hami/4gtv/ofiii)')
+    export.add_argument('--channel', action='append', help='只匯出指定頻道，可重複指定')
+    export.add_argument('--start', type=str, help='開始時間 (ISO格式，默認: 現在)')
+    export.add_argument('--hours', type=float, help='匯出的時數，未指定時匯出開始時間之後的全部節目')
+
+    args = parser.parse_args()
+
+    if args.start:
+        start = _parse_time(args.start)
+    else:
+        start = to_timestamp(datetime.now(TAIPEI_TZ))
+    end = start + int(args.hours * 3600) if args.hours else None
+
+    with ProgrammeStore(args.db) as store:
+        channel_count, program_count = store.export_xmltv(
+            args.output, source=args.source, channels=args.channel, start=start, end=end
+        )
+    logger.success(f"已匯出 {channel_count} 個頻道, {program_count} 個節目: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 import os
-import json
+import argparse
 import requests
 import datetime
 import pytz
@@ -15,6 +15,16 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
+import epg_json
+import epg_export
+import epg_profile
+import epg_logging
+import epg_normalize
+import epg_shard
+from epg_clearance import ClearanceManager, ClearedSession
+from epg_profile import phase
+from epg_parse_pool import ParsePool, from_compact, to_timestamp
+from epg_store import ProgrammeStore, program_rows
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 OUTPUT_DIR = os.path.join(BASE_DIR, 'output')
@@ -39,47 +49,83 @@ def create_cloudscraper():
 def create_session():
     """建立帶有重試機制的會話"""
     session = requests.Session()
+    # 503 通常是 Cloudflare 驗證頁面，交由 ClearedSession 處理而不重試
     retry_strategy = Retry(
         total=3,
         backoff_factor=0.5,
-        status_forcelist=[429, 500, 502, 503, 504],
+        status_forcelist=[429, 500, 502, 504],
         allowed_methods=["GET"]
     )
     adapter = HTTPAdapter(max_retries=retry_strategy)
     session.mount("https://", adapter)
     return session
 
-def get_4gtv_epg():
+def get_4gtv_epg(parse_workers=0, shard=None):
     logger.info("正在獲取 四季線上 電子節目表")
-    channels = get_4gtv_channels()
+    # 載入上次保存的 Cloudflare 憑證，沒有時由 Selenium 或 Cloudscraper 取得
+    clearance = ClearanceManager()
+    clearance.load()
+    
+    with phase('discovery'):
+        # 分片模式下多個 Chrome 可能同時執行，不使用固定的除錯埠
+        channels = get_4gtv_channels(clearance, debug_port=0 if shard else 9222)
+        if shard:
+            channels = shard.select(channels, channel_key)
     programs = []
     
-    # 建立Cloudscraper實例
-    scraper = create_cloudscraper()
+    # 以注入憑證的一般會話請求節目表，憑證被拒絕時才使用Cloudscraper
+    scraper = ClearedSession(clearance, create_session(), create_cloudscraper)
+    progress = epg_logging.ProgressReporter('4gtv', len(channels))
     
-    for channel in channels:
-        channel_id = channel['channelId']
-        channel_name = channel['channelName']
-        
-        # 添加隨機延遲減少請求頻率
-        delay = random.uniform(1.0, 3.0)
-        logger.debug(f"等待 {delay:.2f} 秒後獲取 {channel_name} 節目表")
-        time.sleep(delay)
+    with ParsePool(parse_workers) as pool:
+        with phase('fetch'):
+            # 下載原始節目表後即提交解析，抓取迴圈不等待解析完成
+            pending = []
+            for channel in channels:
+                channel_id = channel['channelId']
+                channel_name = channel['channelName']
+                
+                # 添加隨機延遲減少請求頻率
+                delay = random.uniform(1.0, 3.0)
+                logger.debug(f"等待 {delay:.2f} 秒後獲取 {channel_name} 節目表")
+                time.sleep(delay)
+                
+                text = fetch_4gtv_proglist(channel_id, channel_name, scraper)
+                if text is None:
+                    # 請求細節由 fetch_4gtv_proglist 以 DEBUG 記錄，此處只記錄一次失敗
+                    progress.failure(channel_name, "節目表請求失敗")
+                    continue
+                pending.append((channel, pool.submit(parse_4gtv_proglist, text)))
         
-        try:
-            channel_programs = get_4gtv_programs_scraper(channel_id, channel_name, scraper)
-            if channel_programs:
-                programs.extend(channel_programs)
-                logger.success(f"成功獲取 {channel_name} 節目表 ({len(channel_programs)} 個節目)")
-            else:
-                logger.warning(f"無法獲取 {channel_name} 節目表")
-        except Exception as e:
-            logger.error(f"獲取 {channel_name} 節目表失敗: {e}")
+        with phase('parse'):
+            for channel, future in pending:
+                channel_id = channel['channelId']
+                channel_name = channel['channelName']
+                try:
+                    channel_programs = from_compact(
+                        future.result(), channelId=channel_id, channelName=channel_name
+                    )
+                    if channel_programs:
+                        programs.extend(channel_programs)
+                        progress.success(channel_name, len(channel_programs))
+                    else:
+                        progress.failure(channel_name, "沒有節目資料")
+                except Exception as e:
+                    progress.failure(channel_name, f"解析失敗: {e}")
     
+    progress.finish()
+    logger.info(f"節目表請求: {scraper.fast} 次使用已保存憑證, {scraper.solved} 次經 Cloudscraper 驗證")
     return channels, programs
 
-def get_4gtv_channels():
-    """使用Selenium從線上獲取頻道清單"""
+def channel_key(channel):
+    """分片與合併使用的頻道鍵"""
+    return channel['channelId']
+
+def get_4gtv_channels(clearance=None, debug_port=9222):
+    """使用Selenium從線上獲取頻道清單，並可從瀏覽器取得 Cloudflare 憑證
+
+    debug_port 為 0 時由 Chrome 自行選擇埠號，供同一台機器上的多個分片同時執行。
+    """
     logger.info("正在從線上獲取頻道清單...")
     
     # 設置 Chrome 選項
@@ -93,7 +139,7 @@ def get_4gtv_channels():
     chrome_options.add_argument("--disable-notifications")
     chrome_options.add_argument("--disable-popup-blocking")
     chrome_options.add_argument("--disable-setuid-sandbox")
-    chrome_options.add_argument("--remote-debugging-port=9222")
+    chrome_options.add_argument(f"--remote-debugging-port={debug_port}")
     chrome_options.add_argument("--disable-blink-features=AutomationControlled")
     chrome_options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36")
     
@@ -122,8 +168,8 @@ def get_4gtv_channels():
         if content.strip().startswith('{') or content.strip().startswith('['):
             # 嘗試解析 JSON
             try:
-                data = json.loads(content)
-            except json.JSONDecodeError:
+                data = epg_json.loads(content)
+            except epg_json.JSONDecodeError:
                 logger.error(f"JSON 解析錯誤，內容: {content[:200]}")
                 return []
         else:
@@ -132,7 +178,7 @@ def get_4gtv_channels():
             try:
                 pre_element = driver.find_element("tag name", "pre")
                 content = pre_element.text
-                data = json.loads(content)
+                data = epg_json.loads(content)
             except:
                 logger.error("無法解析內容為 JSON")
                 return []
@@ -142,6 +188,10 @@ def get_4gtv_channels():
             logger.error(f"API 返回無效數據: {data}")
             return []
         
+        # 取得有效的 JSON 才表示瀏覽器已通過 Cloudflare 驗證，此時才保存其憑證
+        if clearance is not None:
+            clearance.harvest_from_driver(driver)
+        
         # 提取所需字段並過濾特定頻道
         extracted_data = []
         for channel in data.get("Data", []):
@@ -149,7 +199,7 @@ def get_4gtv_channels():
             
             # 檢查是否在禁止清單中
             if any(blocked in channel_name for blocked in BLOCKED_CHANNELS):
-                logger.info(f"已跳過頻道: {channel_name}")
+                logger.debug(f"已跳過頻道: {channel_name}")
                 continue
                 
             extracted_data.append({
@@ -159,11 +209,10 @@ def get_4gtv_channels():
                 "fsDESCRIPTION": channel.get("fsDESCRIPTION")
             })
         
-        # 儲存到本地檔案
+        # 儲存到本地檔案（先寫暫存檔再替換，多個分片同時寫入也不會互相截斷）
         os.makedirs(OUTPUT_DIR, exist_ok=True)
         output_path = os.path.join(OUTPUT_DIR, 'fourgtv.json')
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(extracted_data, f, ensure_ascii=False, indent=2)
+        epg_json.dump_file(extracted_data, output_path, indent=True)
         logger.success(f"頻道清單已儲存至: {output_path}")
         
         # 轉換為標準頻道格式
@@ -192,74 +241,95 @@ def get_4gtv_channels():
         except:
             pass
 
-def get_4gtv_programs_scraper(channel_id, channel_name, scraper):
-    """獲取節目表"""
+PROGLIST_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
+    "Referer": "https://www.4gtv.tv/",
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
+    "Origin": "https://www.4gtv.tv",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin"
+}
+
+def fetch_4gtv_proglist(channel_id, channel_name, scraper):
+    """下載節目表原始內容，失敗時返回None（失敗細節以 DEBUG 記錄，由調用方報告失敗）"""
     url = f"https://www.4gtv.tv/ProgList/{channel_id}.txt"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36",
-        "Referer": "https://www.4gtv.tv/",
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
-        "Origin": "https://www.4gtv.tv",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin"
-    }
+    response = None
     
     try:
-        response = scraper.get(url, headers=headers, timeout=15)
+        response = scraper.get(url, headers=PROGLIST_HEADERS, timeout=15)
         response.encoding = "utf-8"
         response.raise_for_status()
+        return response.text
+    
+    except Exception as e:
+        status_code = response.status_code if response is not None else 'N/A'
+        logger.debug(f"獲取 {channel_name} 節目表失敗. URL: {url} 狀態碼: {status_code} 錯誤: {e}")
+        return None
+
+def parse_4gtv_proglist(text):
+    """解析節目表原始內容為精簡節目記錄，可在解析進程池中執行"""
+    # 檢查是否是有效的JSON
+    if not text.strip().startswith(('[', '{')):
+        raise ValueError("返回內容不是有效的JSON")
+    
+    data = epg_json.loads(text)
+    
+    records = []
+    tz = pytz.timezone('Asia/Taipei')
+    
+    for item in data:
+        start_time = tz.localize(datetime.strptime(
+            f"{item['sdate']} {item['stime']}", 
+            "%Y-%m-%d %H:%M:%S"
+        ))
+        end_time = tz.localize(datetime.strptime(
+            f"{item['edate']} {item['etime']}", 
+            "%Y-%m-%d %H:%M:%S"
+        ))
         
-        # 檢查是否是有效的JSON
-        if not response.text.strip().startswith(('[', '{')):
-            raise ValueError("返回內容不是有效的JSON")
-        
-        data = response.json()
-        
-        programs = []
-        tz = pytz.timezone('Asia/Taipei')
-        
-        for item in data:
-            start_time = tz.localize(datetime.strptime(
-                f"{item['sdate']} {item['stime']}", 
-                "%Y-%m-%d %H:%M:%S"
-            ))
-            end_time = tz.localize(datetime.strptime(
-                f"{item['edate']} {item['etime']}", 
-                "%Y-%m-%d %H:%M:%S"
-            ))
-            
-            programs.append({
-                "channelId": channel_id,
-                "channelName": channel_name,
-                "programName": item["title"],
-                "description": item.get("content", ""),
-                "start": start_time,
-                "end": end_time
-            })
-        
-        logger.success(f"成功獲取 {channel_name} 節目表 ({len(programs)} 個節目)")
+        records.append((
+            to_timestamp(start_time),
+            to_timestamp(end_time),
+            item["title"],
+            item.get("content", ""),
+            ""
+        ))
+    
+    return records
+
+def get_4gtv_programs_scraper(channel_id, channel_name, scraper):
+    """獲取節目表"""
+    text = fetch_4gtv_proglist(channel_id, channel_name, scraper)
+    if text is None:
+        logger.warning(f"獲取 {channel_name} 節目表失敗")
+        return None
+    
+    try:
+        programs = from_compact(
+            parse_4gtv_proglist(text), channelId=channel_id, channelName=channel_name
+        )
+        logger.debug(f"成功獲取 {channel_name} 節目表 ({len(programs)} 個節目)")
         return programs
     
     except Exception as e:
-        status_code = response.status_code if 'response' in locals() else 'N/A'
-        logger.error(f"獲取 {channel_name} 節目表失敗. URL: {url} 狀態碼: {status_code} 錯誤: {e}")
+        logger.error(f"解析 {channel_name} 節目表失敗: {e}")
         return None
 
+def normalize_programs(programs):
+    """逐頻道整理節目，生成XML、匯出與寫入資料庫前各執行一次"""
+    return epg_normalize.normalize_programs(programs, "channelName")
+
 def generate_xml(channels, programs, filename):
+    """programs 須已經 normalize_programs 整理"""
     tv = ET.Element("tv", attrib={
         "info-name": "四季線上電子節目表單",
         "info-url": "https://www.4gtv.tv"
     })
     
     # 按頻道名稱分組節目
-    programs_by_channel = {}
-    for program in programs:
-        channel_name = program["channelName"]
-        if channel_name not in programs_by_channel:
-            programs_by_channel[channel_name] = []
-        programs_by_channel[channel_name].append(program)
+    programs_by_channel = epg_normalize.group_by(programs, "channelName")
     
     # 添加頻道和節目信息
     for channel in channels:
@@ -275,10 +345,7 @@ def generate_xml(channels, programs, filename):
         
         # 添加該頻道的節目
         if channel_name in programs_by_channel:
-            # 節目按開始時間排序
-            sorted_programs = sorted(programs_by_channel[channel_name], key=lambda x: x["start"])
-            
-            for program in sorted_programs:
+            for program in programs_by_channel[channel_name]:
                 try:
                     # 格式化時區信息 (+0800)
                     start_str = program["start"].strftime("%Y%m%d%H%M%S %z").replace(" ", "")
@@ -303,17 +370,44 @@ def generate_xml(channels, programs, filename):
     tree.write(filename, encoding="utf-8", xml_declaration=True)
     logger.info(f"電子節目表單已生成: {filename}")
 
+def save_to_store(db_path, channels, programs):
+    """將頻道與節目寫入節目資料庫"""
+    with ProgrammeStore(db_path) as store:
+        store.upsert_channels('4gtv', [
+            (channel["channelName"], channel["channelName"], channel.get("logo"))
+            for channel in channels
+        ])
+        count = store.upsert_programmes('4gtv', program_rows(programs))
+    logger.info(f"已寫入節目資料庫: {db_path} ({count} 個節目)")
+
+def export_compact(base_path, formats, channels, programs):
+    """輸出精簡格式"""
+    channel_ids = [channel["channelName"] for channel in channels]
+    for path in epg_export.export(base_path, formats, channel_ids, program_rows(programs)):
+        logger.info(f"精簡格式已生成: {path}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='四季線上電子節目表單')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                        help='解析進程數，0 表示在主進程解析，-1 表示使用全部CPU核心 (默認: 0)')
+    parser.add_argument('--store', type=str,
+                        help='同時寫入 SQLite 節目資料庫的路徑 (如 output/epg.db)')
+    epg_export.add_arguments(parser)
+    epg_normalize.add_arguments(parser)
+    epg_profile.add_arguments(parser)
+    epg_logging.add_arguments(parser)
+    epg_shard.add_arguments(parser)
+    args = parser.parse_args()
+    epg_profile.setup('4gtv', args)
+    epg_normalize.setup(args)
+    
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     
     log_file = os.path.join(OUTPUT_DIR, 'epg_generator.log')
-    logger.add(
-        log_file,
-        rotation="1 day", 
-        retention="7 days", 
-        encoding="utf-8",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
-    )
+    if args.shard:
+        # 各分片寫入自己的日誌檔，避免多個進程輪替同一個檔案
+        log_file = epg_shard.log_path('4gtv', args.shard)
+    epg_logging.setup_logging(args.log_level, log_file)
     
     try:
         logger.info("="*50)
@@ -321,14 +415,34 @@ if __name__ == "__main__":
         logger.info(f"開始時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         logger.info(f"輸出目錄: {OUTPUT_DIR}")
         
-        channels, programs = get_4gtv_epg()
+        channels, programs = get_4gtv_epg(args.parse_workers, args.shard)
         logger.info(f"共獲取 {len(channels)} 個頻道, {len(programs)} 個節目")
         
+        if args.shard:
+            # 分片模式只寫出部分結果，由 epg_shard.py merge 生成XML
+            epg_shard.write_partial('4gtv', args.shard, channels, programs, channel_key)
+            exit(0)
+        
+        programs = normalize_programs(programs)
+        
         # 設置XML輸出路徑
         xml_file = os.path.join(OUTPUT_DIR, '4g.xml')
-        generate_xml(channels, programs, xml_file)
+        with phase('generate'):
+            generate_xml(channels, programs, xml_file)
+        
+        if args.export:
+            with phase('export'):
+                export_compact(os.path.splitext(xml_file)[0], args.export, channels, programs)
+        
+        if args.store:
+            with phase('store'):
+                save_to_store(args.store, channels, programs)
         logger.success(f"EPG生成完成: {xml_file}")
     except Exception as e:
         logger.critical(f"EPG生成失敗: {str(e)}")
         logger.exception(e)
-        exit(1)
\ No newline at end of file
+        exit(1)
+    finally:
+        profile_path = epg_profile.save()
+        if profile_path:
+            logger.info(f"階段剖析結果已寫入: {profile_path}")
\ No newline at end of file
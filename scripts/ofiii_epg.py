@@ -1,7 +1,6 @@
 import os
 import sys
 import re
-import json
 import time
 import random
 import argparse
@@ -9,8 +8,18 @@ import requests
 import datetime
 import pytz
 from bs4 import BeautifulSoup
+from loguru import logger
 from xml.etree import ElementTree as ET
 from xml.dom import minidom
+import epg_json
+import epg_logging
+import epg_export
+import epg_normalize
+import epg_profile
+import epg_shard
+from epg_profile import phase
+from epg_parse_pool import ParsePool, from_compact, to_timestamp
+from epg_store import ProgrammeStore, program_rows
 
 # 全局時區設置
 TAIPEI_TZ = pytz.timezone('Asia/Taipei')
@@ -65,51 +74,67 @@ def parse_channel_list():
                 channels.append((channel_name, channel_id))
     return channels
 
-def fetch_epg_data(channel_id, max_retries=3):
-    """獲取指定頻道的電視節目表數據"""
+def fetch_page(channel_id, max_retries=3, session=None):
+    """下載指定頻道的觀看頁面原始HTML，可傳入 session 以重用連線
+
+    失敗時返回None，各次嘗試的細節以 DEBUG 記錄，由調用方報告失敗。
+    """
     url = f"https://www.ofiii.com/channel/watch/{channel_id}"
+    http = session or requests
     
     for attempt in range(max_retries):
         try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = http.get(url, headers=HEADERS, timeout=30)
             response.raise_for_status()
             
             # 檢查響應內容
             if not response.text.strip():
-                print(f"⚠️ 響應內容為空: {channel_id}")
+                logger.debug(f"⚠️ 響應內容為空: {channel_id}")
                 return None
-                
-            soup = BeautifulSoup(response.text, 'html.parser')
-            script_tag = soup.find('script', id='__NEXT_DATA__')
             
-            if script_tag and script_tag.string:
-                try:
-                    return json.loads(script_tag.string)
-                except json.JSONDecodeError as e:
-                    print(f"⚠️ JSON解析失敗: {channel_id}, {str(e)}")
-                    return None
-            else:
-                print(f"⚠️ 未找到__NEXT_DATA__標簽: {channel_id}")
-                return None
+            return response.text
                 
         except requests.RequestException as e:
             wait_time = random.uniform(1, 3) * (attempt + 1)
-            print(f"⚠️ 請求失敗 (嘗試 {attempt+1}/{max_retries}), 等待 {wait_time:.2f}秒: {str(e)}")
+            logger.debug(f"⚠️ 請求失敗 (嘗試 {attempt+1}/{max_retries}), 等待 {wait_time:.2f}秒: {str(e)}")
             time.sleep(wait_time)
     
-    print(f"❌ 無法獲取 電視節目表 數據: {channel_id}")
+    logger.debug(f"❌ 無法獲取 電視節目表 數據: {channel_id}")
     return None
 
-def parse_epg_data(json_data, channel_name):
-    """解析電視節目表 JSON數據"""
+def parse_page(html, channel_id):
+    """從觀看頁面HTML中取出__NEXT_DATA__ JSON數據"""
+    soup = BeautifulSoup(html, 'html.parser')
+    script_tag = soup.find('script', id='__NEXT_DATA__')
+    
+    if script_tag and script_tag.string:
+        try:
+            return epg_json.loads(str(script_tag.string))
+        except epg_json.JSONDecodeError as e:
+            logger.debug(f"⚠️ JSON解析失敗: {channel_id}, {str(e)}")
+            return None
+    else:
+        logger.debug(f"⚠️ 未找到__NEXT_DATA__標簽: {channel_id}")
+        return None
+
+def fetch_epg_data(channel_id, max_retries=3):
+    """獲取指定頻道的電視節目表數據"""
+    html = fetch_page(channel_id, max_retries)
+    if html is None:
+        logger.warning(f"❌ 無法獲取 電視節目表 數據: {channel_id}")
+        return None
+    return parse_page(html, channel_id)
+
+def parse_schedule(json_data, channel_name):
+    """解析電視節目表 JSON數據為精簡節目記錄"""
     if not json_data:
         return []
     
-    programs = []
+    records = []
     try:
         # 添加安全檢查
         if not json_data.get('props') or not json_data['props'].get('pageProps') or not json_data['props']['pageProps'].get('channel'):
-            print(f"❌ JSON結構無效: {channel_name}")
+            logger.warning(f"❌ JSON結構無效: {channel_name}")
             return []
         
         schedule = json_data['props']['pageProps']['channel'].get('Schedule', [])
@@ -121,142 +146,179 @@ def parse_epg_data(json_data, channel_name):
                     item['AirDateTime'], "%Y-%m-%dT%H:%M:%SZ"
                 ).replace(tzinfo=pytz.utc)
             except (KeyError, ValueError):
-                print(f"⚠️ 跳過無效的時間格式: {channel_name}")
+                logger.debug(f"⚠️ 跳過無效的時間格式: {channel_name}")
                 continue
-                
-            # 轉換為台北時區
-            start_taipei = start_utc.astimezone(TAIPEI_TZ)
             
             # 計算結束時間
             try:
                 duration = datetime.timedelta(seconds=item.get('Duration', 0))
-                end_taipei = start_taipei + duration
+                end_utc = start_utc + duration
             except TypeError:
-                print(f"⚠️ 跳過無效的持續時間: {channel_name}")
+                logger.debug(f"⚠️ 跳過無效的持續時間: {channel_name}")
                 continue
             
             program_info = item.get('program', {})
             
-            programs.append({
-                "channelName": channel_name,
-                "programName": program_info.get('Title', '未知節目'),
-                "description": program_info.get('Description', ''),
-                "subtitle": program_info.get('SubTitle', ''),
-                "start": start_taipei,
-                "end": end_taipei
-            })
+            records.append((
+                to_timestamp(start_utc),
+                to_timestamp(end_utc),
+                program_info.get('Title', '未知節目'),
+                program_info.get('Description', ''),
+                program_info.get('SubTitle', '')
+            ))
             
     except (KeyError, TypeError, ValueError) as e:
-        print(f"❌ 解析電視節目表數據失敗: {str(e)}")
+        logger.warning(f"❌ 解析電視節目表數據失敗: {str(e)}")
     
-    return programs
+    return records
 
-def get_ofiii_epg():
+def parse_epg_data(json_data, channel_name):
+    """解析電視節目表 JSON數據"""
+    # 時間戳還原時會轉換為台北時區
+    return from_compact(parse_schedule(json_data, channel_name), channelName=channel_name)
+
+def extract_channel_meta(json_data):
+    """取出頻道 logo 與描述，channel 資料無效時返回None"""
+    # 保險起見，先安全取得 pageProps
+    page_props = json_data.get('props', {}).get('pageProps', {})
+    channel_data = page_props.get('channel')
+    introduction = page_props.get('introduction', {}) or {}
+
+    if not isinstance(channel_data, dict):
+        return None
+
+    # 處理 logo（允許為 None）
+    logo = channel_data.get('picture') or introduction.get('image')
+    if logo and not logo.startswith("http"):
+        logo = f"https://p-cdnstatic.svc.litv.tv/{logo}"
+
+    # 處理描述
+    desc = introduction.get('description', '') or channel_data.get('description', '')
+
+    return {"logo": logo, "desc": desc}
+
+def parse_channel_page(html, channel_id, channel_name):
+    """解析觀看頁面為 (頻道資訊, 精簡節目記錄)，可在解析進程池中執行
+
+    頁面無法解析時返回None；channel 資料無效時頻道資訊為None。
+    """
+    json_data = parse_page(html, channel_id)
+    if not json_data:
+        return None
+    return extract_channel_meta(json_data), parse_schedule(json_data, channel_name)
+
+def build_channel_info(channel_name, channel_id, meta):
+    """組裝頻道資料"""
+    channel_info = {
+        "name": channel_name,
+        "channelName": channel_name,
+        "id": channel_id,
+        "url": f"https://www.ofiii.com/channel/watch/{channel_id}",
+        "source": "ofiii",
+        "desc": meta["desc"],
+        "sort": "海外"
+    }
+    if meta["logo"]:
+        channel_info["logo"] = meta["logo"]
+    return channel_info
+
+def get_channel_epg(channel_name, channel_id, session=None):
+    """獲取單一頻道的 (頻道資料, 節目列表)，失敗時返回None"""
+    html = fetch_page(channel_id, session=session)
+    if html is None:
+        logger.warning(f"❌ 頁面請求失敗: {channel_name}")
+        return None
+    
+    result = parse_channel_page(html, channel_id, channel_name)
+    if result is None or result[0] is None:
+        logger.warning(f"❌ 頁面無法解析: {channel_name}")
+        return None
+    
+    meta, records = result
+    return build_channel_info(channel_name, channel_id, meta), from_compact(records, channelName=channel_name)
+
+def get_ofiii_epg(parse_workers=0, shard=None):
     """獲取歐飛電視節目表"""
-    print("="*50)
-    print("開始獲取歐飛電視節目表")
-    print("="*50)
+    logger.info("="*50)
+    logger.info("開始獲取歐飛電視節目表")
+    logger.info("="*50)
     
     # 獲取頻道清單
-    channels_info = parse_channel_list()
+    with phase('discovery'):
+        channels_info = parse_channel_list()
     if not channels_info:
-        print("❌ 無法解析頻道清單")
+        logger.error("❌ 無法解析頻道清單")
         return [], []
+    if shard:
+        channels_info = shard.select(channels_info, lambda channel: channel[1])
     
     all_channels = []
     all_programs = []
-    failed_channels = []
+    progress = epg_logging.ProgressReporter('ofiii', len(channels_info))
     
-    # 遍歷所有頻道
-    for idx, (channel_name, channel_id) in enumerate(channels_info):
-        print(f"\n處理頻道 [{idx+1}/{len(channels_info)}]: {channel_name} ({channel_id})")
-        
-        # 獲取EPG數據
-        json_data = fetch_epg_data(channel_id)
-        if not json_data:
-            failed_channels.append(channel_name)
-            continue
+    with ParsePool(parse_workers) as pool:
+        with phase('fetch'):
+            # 遍歷所有頻道，下載後即提交解析，不等待解析完成
+            pending = []
+            for idx, (channel_name, channel_id) in enumerate(channels_info):
+                logger.debug(f"處理頻道 [{idx+1}/{len(channels_info)}]: {channel_name} ({channel_id})")
+                
+                # 獲取頁面，請求細節由 fetch_page 以 DEBUG 記錄，此處只記錄一次失敗
+                html = fetch_page(channel_id)
+                if html is None:
+                    progress.failure(channel_name, "頁面請求失敗")
+                    continue
+                
+                pending.append((channel_name, channel_id, pool.submit(parse_channel_page, html, channel_id, channel_name)))
+                    
+                # 隨機延遲 (1-3秒)
+                if idx < len(channels_info) - 1:
+                    delay = random.uniform(1, 3)
+                    logger.debug(f"⏱️ 隨機延遲 {delay:.2f}秒")
+                    time.sleep(delay)
             
-        # 解析節目數據
-        programs = parse_epg_data(json_data, channel_name)
-        
-        try:
-            # 保險起見，先安全取得 pageProps
-            page_props = json_data.get('props', {}).get('pageProps', {})
-            channel_data = page_props.get('channel')
-            introduction = page_props.get('introduction', {}) or {}
-
-            if not isinstance(channel_data, dict):
-                print(f"❌ channel_data 不是字典: {channel_name}")
-                failed_channels.append(channel_name)
-                continue
-
-            # 處理 logo（允許為 None）
-            logo = channel_data.get('picture') or introduction.get('image')
-            if logo and not logo.startswith("http"):
-                logo = f"https://p-cdnstatic.svc.litv.tv/{logo}"
-
-            # 處理描述
-            desc = introduction.get('description', '') or channel_data.get('description', '')
-
-            # 組裝頻道資料
-            channel_info = {
-                "name": channel_name,
-                "channelName": channel_name,
-                "id": channel_id,
-                "url": f"https://www.ofiii.com/channel/watch/{channel_id}",
-                "source": "ofiii",
-                "desc": desc,
-                "sort": "海外"
-            }
-            if logo:
-                channel_info["logo"] = logo
+        with phase('parse'):
+            for channel_name, channel_id, future in pending:
+                try:
+                    result = future.result()
+                    if result is None:
+                        progress.failure(channel_name, "頁面無法解析")
+                        continue
+                    
+                    meta, records = result
+                    if meta is None:
+                        progress.failure(channel_name, "channel_data 不是字典")
+                        continue
 
-            all_channels.append(channel_info)
-            all_programs.extend(programs)
+                    all_channels.append(build_channel_info(channel_name, channel_id, meta))
+                    all_programs.extend(from_compact(records, channelName=channel_name))
+                    progress.success(channel_name, len(records))
 
-        except Exception as e:
-            print(f"❌ 解析頻道信息失敗: {channel_name}, {str(e)}")
-            import traceback
-            traceback.print_exc()
-            failed_channels.append(channel_name)
-            continue
-            
-        # 隨機延遲 (1-3秒)
-        if idx < len(channels_info) - 1:
-            delay = random.uniform(1, 3)
-            print(f"⏱️ 隨機延遲 {delay:.2f}秒")
-            time.sleep(delay)
+                except Exception as e:
+                    logger.opt(exception=True).debug(f"解析頻道信息失敗: {channel_name}")
+                    progress.failure(channel_name, f"解析頻道信息失敗: {e}")
+                    continue
     
     # 統計結果
-    print("\n" + "="*50)
-    print(f"✅ 成功獲取 {len(all_channels)} 個頻道")
-    print(f"✅ 成功獲取 {len(all_programs)} 個節目")
-    
-    if failed_channels:
-        print(f"⚠️ 失敗頻道 ({len(failed_channels)}): {', '.join(failed_channels)}")
-    
-    # 按頻道名稱分組顯示節目數量
-    channel_counts = {}
-    for program in all_programs:
-        channel_counts[program["channelName"]] = channel_counts.get(program["channelName"], 0) + 1
-    
-    for channel, count in channel_counts.items():
-        print(f"📺 頻道 {channel}: {count} 個節目")
-    
-    print("="*50)
+    progress.finish()
+    logger.info(f"✅ 成功獲取 {len(all_channels)} 個頻道, {len(all_programs)} 個節目")
     return all_channels, all_programs
 
 
+def normalize_programs(programs):
+    """逐頻道整理節目，生成XML、匯出與寫入資料庫前各執行一次"""
+    return epg_normalize.normalize_programs(programs, "channelName")
+
 def generate_xmltv(channels, programs, output_file="ofiii.xml"):
-    """生成XMLTV格式的EPG數據"""
-    print(f"\n生成XMLTV檔案: {output_file}")
+    """生成XMLTV格式的EPG數據，programs 須已經 normalize_programs 整理"""
+    logger.info(f"生成XMLTV檔案: {output_file}")
     
     # 建立XML根元素
     root = ET.Element("tv", generator="OFIII-EPG-Generator", source="www.ofiii.com")
     
     # 頻道1 -> 頻道1節目 -> 頻道2-> 頻道2節目 -> ...
     program_count = 0
+    programs_by_channel = epg_normalize.group_by(programs, 'channelName')
     for channel in channels:
         channel_name = channel['name']
         
@@ -268,13 +330,10 @@ def generate_xmltv(channels, programs, output_file="ofiii.xml"):
             ET.SubElement(channel_elem, "icon", src=channel['logo'])
         
         # 獲取該頻道的所有節目
-        channel_programs = [p for p in programs if p['channelName'] == channel_name]
+        channel_programs = programs_by_channel.get(channel_name)
         if not channel_programs:
-            print(f"⚠️ 頻道 {channel_name} 沒有節目數據")
+            logger.warning(f"⚠️ 頻道 {channel_name} 沒有節目數據")
             continue
-            
-        # 按開始時間排序
-        channel_programs.sort(key=lambda p: p['start'])
         
         # 添加該頻道的所有節目
         for program in channel_programs:
@@ -301,7 +360,7 @@ def generate_xmltv(channels, programs, output_file="ofiii.xml"):
                 
                 program_count += 1
             except Exception as e:
-                print(f"⚠️ 跳過無效的節目數據: {str(e)}")
+                logger.warning(f"⚠️ 跳過無效的節目數據: {str(e)}")
                 continue
     
     # 生成XML字符串
@@ -312,7 +371,7 @@ def generate_xmltv(channels, programs, output_file="ofiii.xml"):
         parsed = minidom.parseString(xml_str)
         pretty_xml = parsed.toprettyxml(indent="  ", encoding='utf-8')
     except Exception as e:
-        print(f"⚠️ XML美化失敗, 使用原始XML: {str(e)}")
+        logger.warning(f"⚠️ XML美化失敗, 使用原始XML: {str(e)}")
         pretty_xml = xml_str.encode('utf-8')
     
     # 儲存到檔案
@@ -320,46 +379,93 @@ def generate_xmltv(channels, programs, output_file="ofiii.xml"):
         with open(output_file, 'wb') as f:
             f.write(pretty_xml)
         
-        print(f"✅ XMLTV檔案已生成: {output_file}")
-        print(f"📺 頻道數: {len(channels)}")
-        print(f"📺 節目數: {program_count}")
-        print(f"💾 檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
+        logger.success(f"✅ XMLTV檔案已生成: {output_file}")
+        logger.info(f"📺 頻道數: {len(channels)}")
+        logger.info(f"📺 節目數: {program_count}")
+        logger.info(f"💾 檔案大小: {os.path.getsize(output_file) / 1024:.2f} KB")
         return True
     except Exception as e:
-        print(f"❌ 儲存XML檔案失敗: {str(e)}")
+        logger.error(f"❌ 儲存XML檔案失敗: {str(e)}")
         return False
 
+def save_to_store(db_path, channels, programs):
+    """將頻道與節目寫入節目資料庫"""
+    with ProgrammeStore(db_path) as store:
+        store.upsert_channels('ofiii', [
+            (channel['name'], channel['name'], channel.get('logo'))
+            for channel in channels
+        ])
+        count = store.upsert_programmes('ofiii', program_rows(programs))
+    logger.info(f"💾 已寫入節目資料庫: {db_path} ({count} 個節目)")
+
+def export_compact(base_path, formats, channels, programs):
+    """輸出精簡格式"""
+    channel_ids = [channel['name'] for channel in channels]
+    for path in epg_export.export(base_path, formats, channel_ids, program_rows(programs)):
+        logger.info(f"✅ 精簡格式已生成: {path}")
+
 def main():
     """主函數，處理命令行參數"""
     parser = argparse.ArgumentParser(description='歐飛電視節目表')
     parser.add_argument('--output', type=str, default='output/ofiii.xml', 
                        help='輸出XML檔案路徑 (默認: output/ofiii.xml)')
+    parser.add_argument('--parse-workers', type=int, default=0,
+                       help='解析進程數，0 表示在主進程解析，-1 表示使用全部CPU核心 (默認: 0)')
+    parser.add_argument('--store', type=str,
+                       help='同時寫入 SQLite 節目資料庫的路徑 (如 output/epg.db)')
+    epg_export.add_arguments(parser)
+    epg_normalize.add_arguments(parser)
+    epg_profile.add_arguments(parser)
+    epg_logging.add_arguments(parser)
+    epg_shard.add_arguments(parser)
     
     args = parser.parse_args()
+    epg_profile.setup('ofiii', args)
+    epg_normalize.setup(args)
+    epg_logging.setup_logging(args.log_level)
     
     # 確保輸出目錄存在
     output_dir = os.path.dirname(args.output)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir, exist_ok=True)
-        print(f"建立輸出目錄: {output_dir}")
+        logger.info(f"建立輸出目錄: {output_dir}")
     
     try:
         # 獲取EPG數據
-        channels, programs = get_ofiii_epg()
+        channels, programs = get_ofiii_epg(args.parse_workers, args.shard)
+        
+        if args.shard:
+            # 分片模式只寫出部分結果，由 epg_shard.py merge 生成XML
+            epg_shard.write_partial('ofiii', args.shard, channels, programs, lambda channel: channel['id'])
+            return
         
         if not channels or not programs:
-            print("❌ 未獲取到有效EPG數據，無法生成XML")
+            logger.error("❌ 未獲取到有效EPG數據，無法生成XML")
             sys.exit(1)
+        
+        programs = normalize_programs(programs)
             
         # 生成XMLTV檔案
-        if not generate_xmltv(channels, programs, args.output):
+        with phase('generate'):
+            generated = generate_xmltv(channels, programs, args.output)
+        if not generated:
             sys.exit(1)
+        
+        if args.export:
+            with phase('export'):
+                export_compact(os.path.splitext(args.output)[0], args.export, channels, programs)
+        
+        if args.store:
+            with phase('store'):
+                save_to_store(args.store, channels, programs)
             
     except Exception as e:
-        print(f"❌ 主程序錯誤: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.opt(exception=True).critical(f"❌ 主程序錯誤: {str(e)}")
         sys.exit(1)
+    finally:
+        profile_path = epg_profile.save()
+        if profile_path:
+            logger.info(f"⏱️ 階段剖析結果已寫入: {profile_path}")
 
 if __name__ == "__main__":
     main()